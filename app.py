@@ -20,6 +20,7 @@ import profiles.logging
 import profiles.config
 import profiles.factory
 import profiles.cli
+import profiles.orcid
 
 # lsh@2023-03-10: what is this doing? what files is profiles creating?
 os.umask(int('002', 8))
@@ -49,7 +50,8 @@ APP = profiles.factory.create_app(CONFIG, CLIENTS)
 
 @APP.cli.command("clear")
 def clear_command():
-    return profiles.cli.ClearCommand(APP.orcid_tokens, APP.profiles)
+    return profiles.cli.ClearCommand(APP.checkpoints, APP.webhook_jobs, APP.orcid_tokens,
+                                     APP.profiles)
 
 @APP.cli.command("read-configuration")
 @click.option('-s', '--method', 'method', type=str)
@@ -63,12 +65,37 @@ def create_profile_command(name, email):
     return profiles.cli.CreateProfileCommand(APP.profiles, name, email)
 
 @APP.cli.command("set-orcid-webhooks")
-def set_orcid_webhooks_command():
-    return profiles.cli.SetOrcidWebhooksCommand(APP.profiles, CONFIG.orcid, APP.orcid_client, APP.uri_signer)
+@click.option('--resume', 'resume', is_flag=True,
+              help='Carry on after the last profile an interrupted run got through.')
+@click.option('--since', 'since', type=str, metavar='PROFILE_ID',
+              help='Start after this profile (overrides --resume).')
+def set_orcid_webhooks_command(resume, since):
+    return profiles.cli.SetOrcidWebhooksCommand(APP.profiles, APP.checkpoints, CONFIG.orcid, APP.orcid_client,
+                                                APP.uri_signer, resume=resume, since=since)
 
 @APP.cli.command("prune-blocked")
-def prune_blocked():
-    return profiles.cli.prune_blocked(APP.profiles, APP.orcid_tokens, CONFIG.orcid, APP.orcid_client, APP.uri_signer)
+@click.option('-w', '--workers', 'workers', type=int, default=profiles.orcid.DEFAULT_WORKERS,
+              help='Number of ORCID records to fetch at once.')
+@click.option('-r', '--rate', 'rate', type=float, default=profiles.orcid.DEFAULT_RATE,
+              help='Maximum ORCID requests per second, across all workers.')
+@click.option('-b', '--batch-size', 'batch_size', type=int, default=profiles.cli.DEFAULT_BATCH_SIZE,
+              help='Number of profiles to check (and commit deletions for) at a time.')
+@click.option('--resume', 'resume', is_flag=True,
+              help='Carry on after the last batch an interrupted run got through.')
+@click.option('--since', 'since', type=str, metavar='PROFILE_ID',
+              help='Start after this profile (overrides --resume).')
+def prune_blocked(workers, rate, batch_size, resume, since):
+    return profiles.cli.prune_blocked(APP.profiles, APP.orcid_tokens, APP.checkpoints, CONFIG.orcid,
+                                      APP.orcid_client, APP.uri_signer, workers=workers, rate=rate,
+                                      batch_size=batch_size, resume=resume, since=since)
+
+@APP.cli.command("process-webhook-jobs")
+@click.option('--until-empty', 'until_empty', is_flag=True,
+              help='Stop once there are no jobs due, rather than waiting for more.')
+def process_webhook_jobs(until_empty):
+    return profiles.cli.process_webhook_jobs(APP.webhook_jobs, APP.profiles, APP.orcid_tokens,
+                                             CONFIG.orcid, APP.orcid_client,
+                                             until_empty=until_empty)
 
 if __name__ == '__main__':
     # lsh@2023-03-07: manage.py became app.py and manage.py now calls flask with some extra command line args.
@@ -0,0 +1,71 @@
+"""Times rendering pages of profiles: normalizing while encoding with the standard library's
+`default` hook (as the API used to) against normalizing up front and encoding in one pass with
+each JSON backend installed.
+
+Run from the project root with `PYTHONPATH=. python benchmarks/json_encoders.py`, after
+`pip install orjson ujson` to compare them too: neither is a requirement of the project.
+"""
+import argparse
+import json
+import random
+import timeit
+from typing import List
+
+from iso3166 import countries
+
+from profiles.models import Address, Affiliation, Date, Name, Profile, ProfileSnippet
+from profiles.serializer.encoder import available_backends, get_encoder
+from profiles.serializer.normalizer import normalize, normalize_snippet
+
+
+def sample_profiles(size: int, seed: int) -> List[Profile]:
+    generator = random.Random(seed)
+    profiles = []
+
+    for number in range(size):
+        profile = Profile('{:08d}'.format(number), Name('Josiah Carberry {}'.format(number)),
+                          '0000-0002-1825-{:04d}'.format(number))
+        profile.sync_affiliations([
+            Affiliation(str(index), Address(countries.get('us'), 'Providence', 'RI'),
+                        'Brown University', Date(2000 + index), department='Psychoceramics',
+                        restricted=generator.random() < 0.2)
+            for index in range(generator.randint(0, 5))
+        ])
+        for index in range(generator.randint(1, 3)):
+            profile.add_email_address('{}.{}@example.com'.format(number, index))
+        profiles.append(profile)
+
+    return profiles
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-page', type=int, default=100, help='profiles per page')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timings to take')
+    parser.add_argument('--number', type=int, default=20, help='pages rendered per timing')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    profiles = sample_profiles(args.per_page, args.seed)
+    snippets = [ProfileSnippet(profile.id, profile.name.preferred, profile.name.index,
+                               profile.orcid) for profile in profiles]
+
+    runs = [('json default hook', lambda: (
+        [json.dumps(profile, default=normalize) for profile in profiles],
+        json.dumps({'total': len(snippets), 'items': snippets}, default=normalize_snippet),
+    ))]
+    for backend in available_backends():
+        encode = get_encoder(backend)
+        runs.append(('{} up front'.format(backend), lambda encode=encode: (
+            [encode(normalize(profile)) for profile in profiles],
+            encode({'total': len(snippets),
+                    'items': [normalize_snippet(snippet) for snippet in snippets]}),
+        )))
+
+    for name, run in runs:
+        best = min(timeit.repeat(run, number=args.number, repeat=args.repeat)) / args.number
+        print('{:<20}{:8.2f} ms/page'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
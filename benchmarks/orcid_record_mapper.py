@@ -0,0 +1,95 @@
+"""Times pulling profile data out of ORCID records with `jmespath.search`, whose parsed
+expressions are cached, against parsing them again for each record and the precompiled
+`OrcidRecordMapper`.
+
+Run from the project root with `PYTHONPATH=. python benchmarks/orcid_record_mapper.py`.
+"""
+import argparse
+import random
+import timeit
+from typing import List
+
+import jmespath
+from jmespath.parser import Parser
+
+from profiles.commands import ORCID_RECORD_MAPPER
+
+
+def sample_record(employments: int, emails: int) -> dict:
+    return {
+        'path': '/0000-0002-1825-0097',
+        'person': {
+            'name': {'given-names': {'value': 'Josiah'}, 'family-name': {'value': 'Carberry'}},
+            'emails': {'email': [
+                {'email': '{}@example.com'.format(index), 'primary': index == 0,
+                 'verified': index % 3 != 2, 'visibility': 'PUBLIC'}
+                for index in range(emails)
+            ]},
+        },
+        'activities-summary': {
+            'employments': {'employment-summary': [
+                {'put-code': index, 'department-name': 'Department {}'.format(index),
+                 'organization': {'name': 'Organisation {}'.format(index),
+                                  'address': {'city': 'Providence', 'region': 'RI',
+                                              'country': 'US'}},
+                 'start-date': {'year': {'value': str(1990 + index)}}, 'end-date': None,
+                 'visibility': 'PUBLIC'}
+                for index in range(employments)
+            ]},
+            'works': {'group': [{'work-summary': [{'put-code': index, 'title': 'Work'}]}
+                                for index in range(employments * 20)]},
+        },
+    }
+
+
+def sample_records(size: int, seed: int) -> List[dict]:
+    generator = random.Random(seed)
+
+    return [sample_record(generator.randint(0, 20), generator.randint(0, 5))
+            for _ in range(size)]
+
+
+def searched(records: List[dict]) -> None:
+    for record in records:
+        _search(record)
+
+
+def parsed_each_time(records: List[dict]) -> None:
+    for record in records:
+        Parser.purge()
+        _search(record)
+
+
+def _search(record: dict) -> None:
+    """What `commands` did before `OrcidRecordMapper`."""
+    jmespath.search('person.name."given-names".value', record)
+    jmespath.search('person.name."family-name".value', record)
+    emails = jmespath.search('person.emails.email[*]', record) or []
+    list(filter(lambda x: x['verified'], emails))
+    jmespath.search('"activities-summary".employments."employment-summary"[*]', record)
+
+
+def precompiled(records: List[dict]) -> None:
+    for record in records:
+        ORCID_RECORD_MAPPER.name(record)
+        ORCID_RECORD_MAPPER.email_addresses(record)
+        ORCID_RECORD_MAPPER.employments(record)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000, help='size of the sample corpus')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timings to take')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    records = sample_records(args.records, args.seed)
+
+    for name, function in [('jmespath.search', searched), ('parsed each time', parsed_each_time),
+                           ('precompiled', precompiled)]:
+        best = min(timeit.repeat(lambda: function(records), number=1, repeat=args.repeat))
+        print('{:<18}{:8.2f} µs/record'.format(name, best / len(records) * 1000000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '3c8d2e5f1a7b'
+down_revision = 'd4f16fce7228'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_profile_index_name_id', 'profile', ['index_name', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_profile_index_name_id', table_name='profile')
@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '4a7c1e9d2b68'
+down_revision = '8d2f6a1c4b93'
+branch_labels = None
+depends_on = None
+
+email_address_helper = sa.Table(
+    'email_address',
+    sa.MetaData(),
+    sa.Column('email', sa.Text(), primary_key=True),
+    sa.Column('normalized_email', sa.Text(), nullable=True),
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    op.add_column('email_address', sa.Column('normalized_email', sa.Text(), nullable=True))
+
+    connection.execute(email_address_helper.update().values(
+        normalized_email=sa.func.lower(email_address_helper.c.email)))
+
+    op.create_index('ix_email_address_normalized_email', 'email_address', ['normalized_email'])
+
+
+def downgrade():
+    op.drop_index('ix_email_address_normalized_email', table_name='email_address')
+    op.drop_column('email_address', 'normalized_email')
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '5f0c3b7d9e21'
+down_revision = '9b4e6f2a8c17'
+branch_labels = None
+depends_on = None
+
+profile_helper = sa.Table(
+    'profile',
+    sa.MetaData(),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    op.add_column('profile', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    connection.execute(profile_helper.update().values(updated_at=datetime.utcnow()))
+
+    op.create_index('ix_profile_updated_at', 'profile', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_profile_updated_at', table_name='profile')
+    op.drop_column('profile', 'updated_at')
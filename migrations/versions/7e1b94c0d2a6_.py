@@ -0,0 +1,22 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '7e1b94c0d2a6'
+down_revision = '3c8d2e5f1a7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'checkpoint',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('index_name', sa.Text(), nullable=False),
+        sa.Column('profile_id', sa.String(length=8), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('checkpoint')
@@ -0,0 +1,17 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '8d2f6a1c4b93'
+down_revision = '5f0c3b7d9e21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_affiliation_profile_id', 'affiliation', ['profile_id'])
+    op.create_index('ix_email_address_profile_id', 'email_address', ['profile_id'])
+
+
+def downgrade():
+    op.drop_index('ix_email_address_profile_id', table_name='email_address')
+    op.drop_index('ix_affiliation_profile_id', table_name='affiliation')
@@ -0,0 +1,64 @@
+from calendar import monthrange
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '9b4e6f2a8c17'
+down_revision = 'e2a9c7d1b5f3'
+branch_labels = None
+depends_on = None
+
+affiliation_helper = sa.Table(
+    'affiliation',
+    sa.MetaData(),
+    sa.Column('id', sa.Text(), nullable=False),
+    sa.Column('starts_year', sa.Integer(), nullable=True),
+    sa.Column('starts_month', sa.Integer(), nullable=True),
+    sa.Column('starts_day', sa.Integer(), nullable=True),
+    sa.Column('ends_year', sa.Integer(), nullable=True),
+    sa.Column('ends_month', sa.Integer(), nullable=True),
+    sa.Column('ends_day', sa.Integer(), nullable=True),
+    sa.Column('starts_at', sa.DateTime(), nullable=True),
+    sa.Column('ends_at', sa.DateTime(), nullable=True),
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    op.add_column('affiliation', sa.Column('starts_at', sa.DateTime(), nullable=True))
+    op.add_column('affiliation', sa.Column('ends_at', sa.DateTime(), nullable=True))
+
+    for affiliation in connection.execute(affiliation_helper.select()):
+        starts_at = None
+        if affiliation.starts_year:
+            starts_at = datetime(affiliation.starts_year, affiliation.starts_month or 1,
+                                 affiliation.starts_day or 1)
+
+        ends_at = None
+        if affiliation.ends_year:
+            ends_month = affiliation.ends_month or 12
+            ends_at = datetime(affiliation.ends_year, ends_month,
+                               affiliation.ends_day or monthrange(affiliation.ends_year,
+                                                                  ends_month)[1])
+
+        if starts_at or ends_at:
+            connection.execute(
+                affiliation_helper.update().where(
+                    affiliation_helper.c.id == affiliation.id
+                ).values(
+                    starts_at=starts_at,
+                    ends_at=ends_at,
+                )
+            )
+
+    op.create_index('ix_affiliation_starts_at', 'affiliation', ['starts_at'])
+    op.create_index('ix_affiliation_ends_at', 'affiliation', ['ends_at'])
+
+
+def downgrade():
+    op.drop_index('ix_affiliation_ends_at', table_name='affiliation')
+    op.drop_index('ix_affiliation_starts_at', table_name='affiliation')
+    op.drop_column('affiliation', 'ends_at')
+    op.drop_column('affiliation', 'starts_at')
@@ -0,0 +1,25 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'a5d3e8f27c41'
+down_revision = '7e1b94c0d2a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'webhook_job',
+        sa.Column('orcid', sa.String(length=19), nullable=False),
+        sa.Column('enqueued_at', sa.DateTime(), nullable=False),
+        sa.Column('not_before', sa.DateTime(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('orcid')
+    )
+    op.create_index('ix_webhook_job_not_before', 'webhook_job', ['not_before'])
+
+
+def downgrade():
+    op.drop_index('ix_webhook_job_not_before', table_name='webhook_job')
+    op.drop_table('webhook_job')
@@ -0,0 +1,16 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'c81f4b6e9d20'
+down_revision = 'a5d3e8f27c41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('webhook_job', sa.Column('pings', sa.Integer(), nullable=False,
+                                           server_default='1'))
+
+
+def downgrade():
+    op.drop_column('webhook_job', 'pings')
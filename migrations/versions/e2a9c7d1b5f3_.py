@@ -0,0 +1,16 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'e2a9c7d1b5f3'
+down_revision = 'c81f4b6e9d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('profile', sa.Column('orcid_record_fingerprint', sa.String(length=64),
+                                       nullable=True))
+
+
+def downgrade():
+    op.drop_column('profile', 'orcid_record_fingerprint')
@@ -1,13 +1,19 @@
+import base64
 import json
+from datetime import datetime, time, timezone
+from typing import Callable, Dict, List, Tuple
 
-from flask import Blueprint, make_response, request
+from flask import Blueprint, make_response, request, url_for
 from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.http import generate_etag, is_resource_modified
 from werkzeug.wrappers import Response
 
 from profiles.exceptions import ProfileNotFound
+from profiles.models import Profile
 from profiles.repositories import Profiles
+from profiles.serializer.encoder import Encoder, get_encoder
 from profiles.serializer.normalizer import normalize, normalize_restricted, normalize_snippet
-from profiles.utilities import cache
+from profiles.utilities import ResponseCache, cache, utcnow
 
 ORDER_ASC = 'asc'
 ORDER_DESC = 'desc'
@@ -15,10 +21,76 @@ ORDER_DESC = 'desc'
 DEFAULT_ORDER = ORDER_DESC
 DEFAULT_PAGE = 1
 DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+MAX_BATCH_SIZE = 100
 
+VARIANT_PUBLIC = 'public'
+VARIANT_RESTRICTED = 'restricted'
 
-def create_blueprint(profiles: Profiles) -> Blueprint:
+
+def _encode_cursor(index_name: str, profile_id: str) -> str:
+    position = json.dumps([index_name, profile_id]).encode('utf-8')
+
+    return base64.urlsafe_b64encode(position).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        index_name, profile_id = json.loads(position.decode('utf-8'))
+    except (TypeError, ValueError) as exception:
+        raise BadRequest('Invalid cursor') from exception
+
+    if not isinstance(index_name, str) or not isinstance(profile_id, str):
+        raise BadRequest('Invalid cursor')
+
+    return index_name, profile_id
+
+
+def _list_etag(total: int, updated_at: datetime) -> str:
+    return generate_etag('{}|{}|{}'.format(request.full_path, total, updated_at.isoformat())
+                         .encode('utf-8'))
+
+
+def _profile_etag(profile_id: str, variant: str, updated_at: datetime) -> str:
+    # Affiliations start and end at midnight UTC, so which are current (and so the response) can
+    # change then without the profile changing.
+    return generate_etag('{}|{}|{}|{}'.format(profile_id, variant, updated_at.isoformat(),
+                                              utcnow().date().isoformat()).encode('utf-8'))
+
+
+def _profile_last_modified(updated_at: datetime) -> datetime:
+    # Like the ETag, allows for current affiliations changing at midnight UTC.
+    return max(updated_at, datetime.combine(utcnow().date(), time.min, tzinfo=timezone.utc))
+
+
+def _variant() -> Tuple[str, Callable[[Profile], dict]]:
+    """Which version of profiles the consumer may see, and how to normalize it."""
+    if 'view-restricted-profiles' in request.headers.get('x-consumer-groups', '').lower():
+        return VARIANT_RESTRICTED, normalize_restricted
+
+    return VARIANT_PUBLIC, normalize
+
+
+def _is_modified(etag: str, last_modified: datetime) -> bool:
+    """Whether a conditional request has to be answered in full."""
+    return is_resource_modified(request.environ, etag, last_modified=last_modified)
+
+
+def _not_modified(etag: str) -> Response:
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept'
+
+    return response
+
+
+def create_blueprint(profiles: Profiles, response_cache: ResponseCache = None,
+                     encode: Encoder = None) -> Blueprint:
+    """`encode` turns normalized responses into JSON, by default with the fastest library
+    installed (see `profiles.serializer.encoder`)."""
     blueprint = Blueprint('api', __name__)
+    encode = encode or get_encoder()
 
     @blueprint.route('/profiles')
     @cache()
@@ -26,13 +98,17 @@ def create_blueprint(profiles: Profiles) -> Blueprint:
         page = request.args.get('page', DEFAULT_PAGE, type=int)
         per_page = request.args.get('per-page', DEFAULT_PER_PAGE, type=int)
         order = request.args.get('order', DEFAULT_ORDER)
+        cursor = request.args.get('cursor')
+
+        if cursor is not None and 'page' in request.args:
+            raise BadRequest('Page and cursor cannot be combined')
 
         if page < 1:
             raise BadRequest('Page less than 1')
         elif str(page) != str(request.args.get('page', DEFAULT_PAGE)):
             raise BadRequest('Invalid page')
 
-        if per_page < 1 or per_page > 100:
+        if per_page < 1 or per_page > MAX_PER_PAGE:
             raise BadRequest('Per page out of range')
         elif str(per_page) != str(request.args.get('per-page', DEFAULT_PER_PAGE)):
             raise BadRequest('Invalid per page')
@@ -40,35 +116,181 @@ def create_blueprint(profiles: Profiles) -> Blueprint:
         if order not in [ORDER_ASC, ORDER_DESC]:
             raise BadRequest('Invalid order')
 
-        total = len(profiles)
-        profile_list = profiles.list(per_page, (page * per_page) - per_page, order == ORDER_DESC)
+        # Answer revalidation from what's changed before listing anything. The count isn't
+        # the cached one, as that wouldn't see profiles removed by other processes.
+        total, updated_at = profiles.count_and_last_updated_at()
+        etag = _list_etag(total, updated_at) if updated_at else None
+        if etag and not _is_modified(etag, updated_at):
+            return _not_modified(etag)
 
-        if page > 1 and not profile_list:
-            raise NotFound('No page %s' % page)
+        if cursor is not None:
+            after = _decode_cursor(cursor) if cursor else None
+            profile_list = profiles.list_snippets(per_page, desc=order == ORDER_DESC, after=after)
+        else:
+            profile_list = profiles.list_snippets(per_page, (page * per_page) - per_page,
+                                                  order == ORDER_DESC)
 
-        response = make_response(json.dumps({'total': total, 'items': profile_list},
-                                            default=normalize_snippet))
+            if page > 1 and not profile_list:
+                raise NotFound('No page %s' % page)
+
+        response = make_response(encode({
+            'total': total,
+            'items': [normalize_snippet(snippet) for snippet in profile_list],
+        }))
 
         response.headers['Content-Type'] = 'application/vnd.elife.profile-list+json;version=1'
         response.headers['Vary'] = 'Accept'
+        if etag:
+            response.set_etag(etag)
+            response.last_modified = updated_at
+
+        if cursor is not None and len(profile_list) == per_page:
+            last = profile_list[-1]
+            next_cursor = _encode_cursor(last.index_name, last.id)
+            next_uri = url_for('api._list', order=order, cursor=next_cursor,
+                               **{'per-page': per_page})
+            response.headers['Link'] = '<{}>; rel="next"'.format(next_uri)
 
         return response
 
-    @blueprint.route('/profiles/<profile_id>')
+    def _profile_ids_by_email_address(email_addresses: List[str]) -> Dict[str, str]:
+        # Restricted email addresses mustn't give away whose they are.
+        return profiles.get_profile_ids_by_email_address(
+            *email_addresses, include_restricted=_variant()[0] == VARIANT_RESTRICTED)
+
+    def _render_many(profile_ids: List[str]) -> List[bytes]:
+        """Rendered profiles that exist out of `profile_ids`, in that order, reusing cached
+        ones that are still current and loading the rest together."""
+        variant, normalizer = _variant()
+        rendered = {}
+
+        updated_at = profiles.get_many_updated_at(profile_ids)
+        profile_ids = [profile_id for profile_id in profile_ids if profile_id in updated_at]
+
+        if response_cache is not None:
+            for profile_id in profile_ids:
+                cached = response_cache.get(profile_id, variant)
+                if cached is not None and updated_at[profile_id] and \
+                        cached[1] == _profile_etag(profile_id, variant, updated_at[profile_id]):
+                    rendered[profile_id] = cached[0]
+
+        missing = [profile_id for profile_id in profile_ids if profile_id not in rendered]
+        if missing:
+            generation = response_cache.generation if response_cache is not None else None
+
+            for profile in profiles.get_many(missing, eager=True):
+                body = encode(normalizer(profile))
+                rendered[profile.id] = body
+
+                if response_cache is not None and profile.updated_at:
+                    response_cache.put(profile.id, variant, body,
+                                       _profile_etag(profile.id, variant, profile.updated_at),
+                                       generation)
+
+        return [rendered[profile_id] for profile_id in profile_ids if profile_id in rendered]
+
+    @blueprint.route('/profiles/batch')
     @cache()
-    def _get(profile_id: str) -> Response:
+    def _batch() -> Response:
+        profile_ids = request.args.getlist('id')
+        orcids = request.args.getlist('orcid')
+        email_addresses = request.args.getlist('email')
+
+        if not profile_ids and not orcids and not email_addresses:
+            raise BadRequest('No profile IDs, ORCID iDs or email addresses')
+        elif len(profile_ids) + len(orcids) + len(email_addresses) > MAX_BATCH_SIZE:
+            raise BadRequest('More than {} profile IDs, ORCID iDs and email addresses'
+                             .format(MAX_BATCH_SIZE))
+
+        if orcids:
+            found = profiles.get_profile_ids_by_orcid(*orcids)
+            profile_ids += [found[orcid] for orcid in orcids if orcid in found]
+        if email_addresses:
+            found = _profile_ids_by_email_address(email_addresses)
+            profile_ids += [found[email] for email in email_addresses if email in found]
+
+        items = _render_many(list(dict.fromkeys(profile_ids)))
+
+        # The profiles are already encoded, so are put into the list as they are. They're whole
+        # profiles rather than the snippets of a profile list, so have a media type of their own.
+        response = make_response(b''.join([
+            b'{"total":', str(len(items)).encode('utf-8'), b',"items":[', b','.join(items), b']}'
+        ]))
+        response.headers['Content-Type'] = 'application/vnd.elife.profile-batch+json;version=1'
+        response.headers['Vary'] = 'Accept'
+
+        return response
+
+    def _render(profile_id: str) -> Response:
+        variant, normalizer = _variant()
+
+        # Other processes don't invalidate this one's cache, so responses are checked against
+        # when the profile last changed before they're used, and revalidation is answered from
+        # it before anything is loaded.
         try:
-            profile = profiles.get(profile_id)
+            updated_at = profiles.get_updated_at(profile_id)
         except ProfileNotFound as exception:
             raise NotFound(str(exception)) from exception
 
-        if 'view-restricted-profiles' in request.headers.get('x-consumer-groups', '').lower():
-            response = make_response(json.dumps(profile, default=normalize_restricted))
+        etag = _profile_etag(profile_id, variant, updated_at) if updated_at else None
+        if etag and not _is_modified(etag, _profile_last_modified(updated_at)):
+            return _not_modified(etag)
+
+        cached = None
+        if response_cache is not None and etag:
+            cached = response_cache.get(profile_id, variant)
+
+        if cached is not None and cached[1] == etag:
+            body = cached[0]
         else:
-            response = make_response(json.dumps(profile, default=normalize))
+            generation = response_cache.generation if response_cache is not None else None
+
+            try:
+                profile = profiles.get(profile_id, eager=True)
+            except ProfileNotFound as exception:
+                raise NotFound(str(exception)) from exception
+
+            body = encode(normalizer(profile))
+            updated_at = profile.updated_at
+            if updated_at:
+                etag = _profile_etag(profile.id, variant, updated_at)
+                if response_cache is not None:
+                    response_cache.put(profile_id, variant, body, etag, generation)
+            else:
+                etag = generate_etag(body)
+
+        response = make_response(body)
+        response.set_etag(etag)
+        if updated_at:
+            response.last_modified = _profile_last_modified(updated_at)
         response.headers['Content-Type'] = 'application/vnd.elife.profile+json;version=1'
         response.headers['Vary'] = 'Accept'
 
         return response
 
+    @blueprint.route('/profiles/<profile_id>')
+    @cache()
+    def _get(profile_id: str) -> Response:
+        return _render(profile_id)
+
+    @blueprint.route('/profiles/orcid/<orcid>')
+    @cache()
+    def _get_by_orcid(orcid: str) -> Response:
+        profile_id = profiles.get_profile_ids_by_orcid(orcid).get(orcid)
+
+        if profile_id is None:
+            raise NotFound('Profile with ORCID {} not found'.format(orcid))
+
+        return _render(profile_id)
+
+    @blueprint.route('/profiles/email/<email>')
+    @cache()
+    def _get_by_email_address(email: str) -> Response:
+        profile_id = _profile_ids_by_email_address([email]).get(email)
+
+        if profile_id is None:
+            raise NotFound('Profile with email address {} not found'.format(email))
+
+        return _render(profile_id)
+
     return blueprint
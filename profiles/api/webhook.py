@@ -7,17 +7,19 @@ from requests import RequestException
 from werkzeug.exceptions import InternalServerError, NotFound, ServiceUnavailable
 from werkzeug.wrappers import Response
 
-from profiles.commands import update_profile_from_orcid_record
-from profiles.exceptions import OrcidTokenNotFound, ProfileNotFound
+from profiles.commands import update_profile_from_orcid
+from profiles.exceptions import OrcidTokenRejected, ProfileNotFound
 from profiles.orcid import OrcidClient
-from profiles.repositories import OrcidTokens, Profiles
+from profiles.repositories import OrcidTokens, Profiles, WebhookJobs
 
 LOGGER = logging.getLogger(__name__)
 
 
 def create_blueprint(profiles: Profiles, orcid_config: Dict[str, str],
                      orcid_client: OrcidClient, orcid_tokens: OrcidTokens,
-                     uri_signer: URLSafeSerializer) -> Blueprint:
+                     uri_signer: URLSafeSerializer, webhook_jobs: WebhookJobs = None) -> Blueprint:
+    """If `webhook_jobs` is given, updates are queued for `process-webhook-jobs` to carry out
+    rather than being made while ORCID waits for a response."""
     blueprint = Blueprint('webhook', __name__)
 
     @blueprint.route('/orcid-webhook/<payload>', methods=['POST'])
@@ -32,34 +34,26 @@ def create_blueprint(profiles: Profiles, orcid_config: Dict[str, str],
                          uri_signer.loads_unsafe(payload)[-1])
             raise NotFound from exception
 
-        try:
-            profile = profiles.get_by_orcid(orcid)
-        except ProfileNotFound as exception:
-            raise NotFound(str(exception)) from exception
+        if webhook_jobs is not None:
+            try:
+                profiles.get_by_orcid(orcid)
+            except ProfileNotFound as exception:
+                raise NotFound(str(exception)) from exception
 
-        try:
-            access_token = orcid_tokens.get(profile.orcid).access_token
-        except OrcidTokenNotFound:
-            LOGGER.info('OrcidTokenNotFound: Access Token not found for %s. '
-                        'Reverting to public access token', profile.orcid)
-            access_token = orcid_config.get('read_public_access_token')
+            webhook_jobs.enqueue(orcid)
+
+            return Response(status=202)
 
         try:
-            orcid_record = orcid_client.get_record(orcid, access_token)
+            update_profile_from_orcid(orcid, profiles, orcid_tokens, orcid_config, orcid_client)
+        except ProfileNotFound as exception:
+            raise NotFound(str(exception)) from exception
+        except OrcidTokenRejected as exception:
+            # Let ORCID retry, it will use the public access token
+            raise ServiceUnavailable from exception
         except RequestException as exception:
-            # lsh@2023-05-09: exception.response may be None
-            # https://requests.readthedocs.io/en/latest/_modules/requests/exceptions/#RequestException
-            if exception.response is not None and exception.response.status_code == 403:
-                if not access_token == orcid_config.get('read_public_access_token'):
-                    orcid_tokens.remove(profile.orcid)
-
-                    # Let ORCID retry, it will use the public access token
-                    raise ServiceUnavailable from exception
-
             raise InternalServerError from exception
 
-        update_profile_from_orcid_record(profile, orcid_record)
-
         return Response(status=204)
 
     return blueprint
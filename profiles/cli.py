@@ -1,17 +1,30 @@
 import time
 import json
 import logging
-from typing import Dict
+from typing import Dict, Optional, Tuple
+import click
 from flask import url_for
 from itsdangerous import URLSafeSerializer
-from profiles.exceptions import ProfileNotFound
-from profiles.models import Name, Profile
-from profiles.orcid import OrcidClient
-from profiles.repositories import Profiles, OrcidTokens
+from profiles.commands import update_profile_from_orcid
+from profiles.exceptions import CheckpointNotFound, OrcidTokenRejected, ProfileNotFound
+from profiles.models import Name, Profile, WebhookJob
+from profiles.orcid import BulkRecordFetcher, DEFAULT_RATE, DEFAULT_WORKERS, OrcidClient
+from profiles.repositories import Checkpoints, OrcidTokens, Profiles, WebhookJobs
 from profiles.types import CanBeCleared
 import requests.exceptions
 LOGGER = logging.getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 500
+
+DEFAULT_JOB_LEASE = 60
+DEFAULT_POLL_INTERVAL = 5
+MAX_JOB_ATTEMPTS = 6
+JOB_RETRY_BACKOFF = 30
+
+# names of the checkpoints saved by long-running commands
+PRUNE_BLOCKED = 'prune-blocked'
+SET_ORCID_WEBHOOKS = 'set-orcid-webhooks'
+
 def ReadConfiguration(config, method) -> None:
     "Allows calling a method on the Config object to print its result"
     if method:
@@ -42,78 +55,126 @@ def CreateProfileCommand(profiles: Profiles, name, email) -> None:
     else:
         print('Error: Please provide valid strings for both `--name` and `--email`')
 
-def SetOrcidWebhooksCommand(profiles: Profiles, orcid: Dict[str, str], orcid_client: OrcidClient,
-                            uri_signer: URLSafeSerializer) -> None:
+def _start_position(profiles: Profiles, checkpoints: Checkpoints, name: str, resume: bool,
+                    since: Optional[str]) -> Optional[Tuple[str, str]]:
+    """where to start a sweep over the profiles from: after profile `since` if given, otherwise
+    after the checkpoint saved by the last run if `resume`, otherwise from the beginning."""
+    if since:
+        try:
+            profile = profiles.get(since)
+        except ProfileNotFound as exception:
+            raise click.BadParameter('Unknown profile {}'.format(since),
+                                     param_hint='--since') from exception
+        return profile.name.index, profile.id
+
+    if resume:
+        try:
+            checkpoint = checkpoints.get(name)
+            LOGGER.info("resuming %s after profile %s", name, checkpoint.profile_id)
+            return checkpoint.position
+        except CheckpointNotFound:
+            LOGGER.info("no checkpoint for %s, starting from the beginning", name)
+
+    return None
+
+def SetOrcidWebhooksCommand(profiles: Profiles, checkpoints: Checkpoints, orcid: Dict[str, str],
+                            orcid_client: OrcidClient, uri_signer: URLSafeSerializer,
+                            resume: bool = False, since: str = None,
+                            batch_size: int = DEFAULT_BATCH_SIZE) -> None:
     access_token = orcid.get('webhook_access_token')
-    profiles = profiles.list()
+    after = _start_position(profiles, checkpoints, SET_ORCID_WEBHOOKS, resume, since)
     total = len(profiles)
-    for index, profile in enumerate(profiles):
-        LOGGER.debug('%s of %s: %s', index + 1, total, profile)
-        uri = url_for('webhook._update', payload=uri_signer.dumps(profile.orcid),
-                      _external=True)
-        orcid_client.set_webhook(profile.orcid, uri, access_token)
+    index = 0
+
+    for batch in profiles.iterate_snippets(batch_size, after):
+        for profile in batch:
+            index += 1
+            LOGGER.debug('%s of %s: %s', index, total, profile)
+            if profile.orcid is None:
+                continue
+            uri = url_for('webhook._update', payload=uri_signer.dumps(profile.orcid),
+                          _external=True)
+            orcid_client.set_webhook(profile.orcid, uri, access_token)
+
+        checkpoints.save(SET_ORCID_WEBHOOKS, batch[-1].position)
+        profiles.db.session.commit()
+
+    checkpoints.remove(SET_ORCID_WEBHOOKS)
+    profiles.db.session.commit()
 
-def prune_blocked(profiles: Profiles, orcid_tokens: OrcidTokens, orcid_config: Dict[str, str], orcid_client: OrcidClient, uri_signer: URLSafeSerializer) -> None:
+def prune_blocked(profiles: Profiles, orcid_tokens: OrcidTokens, checkpoints: Checkpoints,
+                  orcid_config: Dict[str, str], orcid_client: OrcidClient,
+                  uri_signer: URLSafeSerializer, workers: int = DEFAULT_WORKERS,
+                  rate: float = DEFAULT_RATE, batch_size: int = DEFAULT_BATCH_SIZE,
+                  resume: bool = False, since: str = None) -> None:
     """command fetches each known profile and purges it if the API responds with a HTTP 409.
-    the API may respond with a HTTP 409 if the profile has been blocked/disabled."""
+    the API may respond with a HTTP 409 if the profile has been blocked/disabled.
+
+    profiles are read `batch_size` at a time and their records fetched by `workers` threads,
+    making at most `rate` requests per second between them. deletions are committed once per batch,
+    along with a checkpoint that `resume` carries on from if the command is interrupted."""
     access_token = orcid_config.get('webhook_access_token')
+    fetcher = BulkRecordFetcher(orcid_client.rate_limited(rate), access_token, workers)
 
     problem_profiles = {}
+    num_profiles = len(profiles)
+    checked = 0
+    after = _start_position(profiles, checkpoints, PRUNE_BLOCKED, resume, since)
 
     try:
-        profiles_list = profiles.list()
-        num_profiles = len(profiles_list)
-        for i, profile in enumerate(profiles_list):
-            orcid = profile.orcid
+        for batch in profiles.iterate_snippets(batch_size, after):
+            profile_ids = {snippet.orcid: snippet.id for snippet in batch if snippet.orcid}
+            blocked = []
+            failed = False
 
-            LOGGER.info("checking profile %d of %d: %s", i, num_profiles, orcid)
+            for orcid, _, ex in fetcher.fetch(profile_ids):
+                if ex is None:
+                    continue
+                problem_profiles[profile_ids[orcid]] = str(ex)
+                if isinstance(ex, requests.exceptions.HTTPError):
+                    if ex.response.status_code == 409:
+                        # https://github.com/ORCID/ORCID-Source/blob/main/orcid-api-web/tutorial/api_errors.md
+                        # "This record was flagged as violating ORCID's Terms of Use and has been hidden from public view."
+                        blocked.append(orcid)
+                else:
+                    LOGGER.error("unhandled exception processing profile with orcid %s: %s",
+                                 orcid, str(ex))
+                    failed = True
 
-            if orcid is None:
-                continue
+            for orcid in blocked:
+                # lsh@2024-04-10: hook removal is (somehow) tied to deleting a Profile and happens on COMMIT.
+                # make sure your app.cfg `orcid.api_uri` isn't set to prod during dev.
+                try:
+                    LOGGER.info("removing profile for orcid %s", orcid)
+                    profiles.remove(orcid)
+                except Exception as ex2:
+                    LOGGER.error("failed to delete profile for orcid %s: %s", orcid, str(ex2))
+
+                try:
+                    LOGGER.info("removing orcid token access token for orcid %s", orcid)
+                    orcid_tokens.remove(orcid)
+                except Exception as ex3:
+                    LOGGER.error("failed to delete orcid_token for orcid %s: %s", orcid, str(ex3))
+
+            if not failed:
+                checkpoints.save(PRUNE_BLOCKED, batch[-1].position)
 
             try:
-                orcid_client.get_record(orcid, access_token)
-
-            except requests.exceptions.HTTPError as ex:
-                problem_profiles[profile.id] = str(ex)
-                if ex.response.status_code == 409:
-                    # https://github.com/ORCID/ORCID-Source/blob/main/orcid-api-web/tutorial/api_errors.md
-                    # "This record was flagged as violating ORCID's Terms of Use and has been hidden from public view."
-
-                    # lsh@2024-04-10: hook removal is (somehow) tied to deleting a Profile and happens on COMMIT.
-                    # make sure your app.cfg `orcid.api_uri` isn't set to prod during dev.
-                    #try:
-                    #    LOGGER.info("removing webhook for orcid %s", orcid)
-                    #    uri = url_for('webhook._update', payload=uri_signer.dumps(orcid), _external=True)
-                    #    orcid_client.remove_webhook(orcid, uri, access_token)
-                    #except Exception as ex1:
-                    #    LOGGER.error("failed to remove webhook for orcid %s: %s", orcid, str(ex1))
-
-                    try:
-                        LOGGER.info("removing profile for orcid %s", orcid)
-                        profiles.remove(orcid)
-                    except Exception as ex2:
-                        LOGGER.error("failed to delete profile for orcid %s: %s", orcid, str(ex2))
-
-                    try:
-                        LOGGER.info("removing orcid token access token for orcid %s", orcid)
-                        orcid_tokens.remove(orcid)
-                    except Exception as ex3:
-                        LOGGER.error("failed to delete orcid_token for orcid %s: %s", orcid, str(ex3))
-
-                    try:
-                        LOGGER.info("commiting")
-                        profiles.db.session.commit()
-                    except Exception as ex4:
-                        LOGGER.error("failed to commit changes to database for orcid %s: %s", orcid, str(ex4))
-
-            except Exception as e:
-                problem_profiles[profile.id] = str(e)
-                LOGGER.error("unhandled exception processing profile with orcid %s: %s", orcid, str(e))
-                break
+                LOGGER.info("commiting removal of %d blocked profile(s)", len(blocked))
+                profiles.db.session.commit()
+            except Exception as ex4:
+                profiles.db.session.rollback()
+                LOGGER.error("failed to commit changes to database for orcids %s: %s",
+                             ', '.join(blocked), str(ex4))
 
-            # disabled, job isn't completing inside 8hrs
-            #time.sleep(1 / 4) # 250ms, max 4req/s when running sequentially
+            checked += len(batch)
+            LOGGER.info("checked %d of %d profiles", checked, num_profiles)
+
+            if failed:
+                break
+        else:
+            checkpoints.remove(PRUNE_BLOCKED)
+            profiles.db.session.commit()
 
     except KeyboardInterrupt:
         pass
@@ -123,3 +184,79 @@ def prune_blocked(profiles: Profiles, orcid_tokens: OrcidTokens, orcid_config: D
         print(json.dumps(problem_profiles, indent=4))
 
     return None
+
+def process_webhook_jobs(webhook_jobs: WebhookJobs, profiles: Profiles, orcid_tokens: OrcidTokens,
+                         orcid_config: Dict[str, str], orcid_client: OrcidClient,
+                         until_empty: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                         lease: float = DEFAULT_JOB_LEASE) -> None:
+    """command updates the profiles queued by the ORCID webhook, until interrupted or, with
+    `until_empty`, until there are none left.
+
+    several can run at once: each job is leased to one of them for `lease` seconds at a time.
+    pings for an ORCID iD that arrive while its job is waiting are collapsed into that job."""
+    session = profiles.db.session
+    updates = 0
+    pings = 0
+
+    try:
+        while True:
+            job = webhook_jobs.claim(lease)
+            session.commit()
+
+            if job is None:
+                if until_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                updated = _process_webhook_job(job, webhook_jobs, profiles, orcid_tokens,
+                                               orcid_config, orcid_client)
+                session.commit()
+            except Exception as ex:
+                session.rollback()
+                _retry_webhook_job(job, webhook_jobs, ex)
+                session.commit()
+                continue
+
+            if updated:
+                updates += 1
+                pings += job.pings
+                LOGGER.info("handled %d webhook ping(s) for orcid %s with one update",
+                            job.pings, job.orcid)
+
+    except KeyboardInterrupt:
+        pass
+
+    LOGGER.info("handled %d webhook ping(s) with %d update(s), %d collapsed",
+                pings, updates, pings - updates)
+
+def _process_webhook_job(job: WebhookJob, webhook_jobs: WebhookJobs, profiles: Profiles,
+                         orcid_tokens: OrcidTokens, orcid_config: Dict[str, str],
+                         orcid_client: OrcidClient) -> bool:
+    """returns whether the profile was updated."""
+    try:
+        update_profile_from_orcid(job.orcid, profiles, orcid_tokens, orcid_config, orcid_client)
+    except ProfileNotFound:
+        LOGGER.info("dropping webhook job for unknown orcid %s", job.orcid)
+        webhook_jobs.complete(job)
+        return False
+    except OrcidTokenRejected:
+        LOGGER.info("access token for orcid %s rejected, retrying with the public one", job.orcid)
+        webhook_jobs.retry(job, 0)
+        return False
+
+    webhook_jobs.complete(job)
+    return True
+
+def _retry_webhook_job(job: WebhookJob, webhook_jobs: WebhookJobs, ex: Exception) -> None:
+    if job.attempts >= MAX_JOB_ATTEMPTS:
+        LOGGER.error("giving up on webhook job for orcid %s after %d attempts: %s",
+                     job.orcid, job.attempts, str(ex))
+        webhook_jobs.complete(job)
+        return
+
+    delay = JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+    LOGGER.warning("webhook job for orcid %s failed (attempt %d), retrying in %ds: %s",
+                   job.orcid, job.attempts, delay, str(ex))
+    webhook_jobs.retry(job, delay)
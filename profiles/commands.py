@@ -1,24 +1,127 @@
+import hashlib
+import json
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.exc import IntegrityError
 
 from iso3166 import countries
 import jmespath
+from requests import RequestException
 
-from profiles.exceptions import ProfileNotFound
-from profiles.models import Address, Affiliation, Date, Name, Profile, db
-from profiles.orcid import VISIBILITY_PUBLIC
-from profiles.repositories import SQLAlchemyProfiles
+from profiles.exceptions import OrcidTokenNotFound, OrcidTokenRejected
+from profiles.models import Address, Affiliation, Date, EmailAddress, Name, Profile, db
+from profiles.orcid import OrcidClient, RECORD_MODE_FULL, RECORD_MODE_SECTIONS, VISIBILITY_PUBLIC
+from profiles.repositories import OrcidTokens, Profiles, SQLAlchemyProfiles
 
 LOGGER = logging.getLogger(__name__)
 
+# Bump this when changing what's taken from ORCID records, so that every profile is updated in
+# full the next time its record is seen.
+ORCID_RECORD_FINGERPRINT_VERSION = 1
+
+ORCID_RECORD_FINGERPRINT_FIELDS = jmespath.compile('''{
+    path: path,
+    name: person.name.{given: "given-names".value, family: "family-name".value},
+    employments: "activities-summary".employments."employment-summary"[*].{
+        id: "put-code", department: "department-name", organization: organization,
+        start: "start-date", end: "end-date", visibility: visibility
+    }
+}''')
+
+
+class OrcidRecordMapper(object):
+    """Pulls out of ORCID records what profiles are made from, with expressions compiled once.
+
+    Lists are taken through projections (`[*]`), which leave out null elements and give new
+    lists, so callers can't change the record."""
+    GIVEN_NAMES = jmespath.compile('person.name."given-names".value')
+    FAMILY_NAME = jmespath.compile('person.name."family-name".value')
+    EMAIL_ADDRESSES = jmespath.compile('person.emails.email[*]')
+    EMPLOYMENTS = jmespath.compile('"activities-summary".employments."employment-summary"[*]')
+
+    def name(self, orcid_record: dict) -> Tuple[Optional[str], Optional[str]]:
+        """Given and family names."""
+        return self.GIVEN_NAMES.search(orcid_record), self.FAMILY_NAME.search(orcid_record)
+
+    def email_addresses(self, orcid_record: dict, only_verified: bool = True) -> List[dict]:
+        orcid_emails = self.EMAIL_ADDRESSES.search(orcid_record) or []
+
+        if only_verified:
+            return [orcid_email for orcid_email in orcid_emails if orcid_email['verified']]
+
+        return orcid_emails
+
+    def employments(self, orcid_record: dict) -> List[dict]:
+        return self.EMPLOYMENTS.search(orcid_record) or []
+
+
+ORCID_RECORD_MAPPER = OrcidRecordMapper()
+
+
+def update_profile_from_orcid(orcid: str, profiles: Profiles, orcid_tokens: OrcidTokens,
+                              orcid_config: Dict[str, str], orcid_client: OrcidClient) -> Profile:
+    """Fetches the ORCID record for `orcid` and updates the profile with it.
+
+    If ORCID rejects the profile's own access token it is removed and `OrcidTokenRejected` is
+    raised, so that trying again uses the public access token."""
+    profile = profiles.get_by_orcid(orcid, eager=True)
+
+    try:
+        access_token = orcid_tokens.get(profile.orcid).access_token
+    except OrcidTokenNotFound:
+        LOGGER.info('OrcidTokenNotFound: Access Token not found for %s. '
+                    'Reverting to public access token', profile.orcid)
+        access_token = orcid_config.get('read_public_access_token')
+
+    try:
+        if orcid_config.get('record_mode', RECORD_MODE_FULL) == RECORD_MODE_SECTIONS:
+            orcid_record = orcid_client.get_partial_record(orcid, access_token)
+        else:
+            orcid_record = orcid_client.get_record(orcid, access_token)
+    except RequestException as exception:
+        # lsh@2023-05-09: exception.response may be None
+        # https://requests.readthedocs.io/en/latest/_modules/requests/exceptions/#RequestException
+        if exception.response is not None and exception.response.status_code == 403:
+            if not access_token == orcid_config.get('read_public_access_token'):
+                orcid_tokens.remove(profile.orcid)
+
+                raise OrcidTokenRejected(str(exception)) from exception
+
+        raise
+
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    return profile
+
+
+def orcid_record_fingerprint(orcid_record: dict) -> str:
+    """Hash of the parts of an ORCID record that profiles are updated from."""
+    fields = ORCID_RECORD_FINGERPRINT_FIELDS.search(orcid_record)
+    fields['version'] = ORCID_RECORD_FINGERPRINT_VERSION
+    fields['emails'] = [{'email': email.get('email'), 'primary': email.get('primary'),
+                         'visibility': email.get('visibility')}
+                        for email in extract_email_addresses(orcid_record)]
+
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, separators=(',', ':'))
+                          .encode('utf-8')).hexdigest()
+
 
 def update_profile_from_orcid_record(profile: Profile, orcid_record: dict) -> None:
+    fingerprint = orcid_record_fingerprint(orcid_record)
+    if fingerprint == profile.orcid_record_fingerprint:
+        LOGGER.info('Profile %s is up to date with ORCID record %s', profile.id,
+                    orcid_record.get('path'))
+        return
+
     try:
         LOGGER.info('Updating profile %s with ORCID record %s', profile.id, orcid_record.get('path'))
         _update_name_from_orcid_record(profile, orcid_record)
         _update_affiliations_from_orcid_record(profile, orcid_record)
-        _update_email_addresses_from_orcid_record(profile, orcid_record)
+        if _update_email_addresses_from_orcid_record(profile, orcid_record):
+            profile.orcid_record_fingerprint = fingerprint
+        else:
+            # email addresses owned by other profiles are tried again on the next update
+            profile.orcid_record_fingerprint = None
     except IntegrityError:
         # lsh@2023-02-22: we've had three cases of an update failing, the transaction not being rolled back and
         # subsequent incoming updates failing because of this db.session's state.
@@ -32,17 +135,11 @@ def update_profile_from_orcid_record(profile: Profile, orcid_record: dict) -> No
         raise
 
 def extract_email_addresses(orcid_record: dict, only_verified: bool = True) -> List[dict]:
-    orcid_emails = jmespath.search('person.emails.email[*]', orcid_record) or []
-
-    if only_verified:
-        orcid_emails = list(filter(lambda x: x['verified'], orcid_emails))
-
-    return orcid_emails
+    return ORCID_RECORD_MAPPER.email_addresses(orcid_record, only_verified)
 
 
 def _update_name_from_orcid_record(profile: Profile, orcid_record: dict) -> None:
-    given_name = jmespath.search('person.name."given-names".value', orcid_record)
-    family_name = jmespath.search('person.name."family-name".value', orcid_record)
+    given_name, family_name = ORCID_RECORD_MAPPER.name(orcid_record)
 
     if given_name and family_name:
         profile.name = Name('{} {}'.format(given_name, family_name),
@@ -54,15 +151,12 @@ def _update_name_from_orcid_record(profile: Profile, orcid_record: dict) -> None
 
 
 def _update_affiliations_from_orcid_record(profile: Profile, orcid_record: dict) -> None:
-    orcid_affiliations = jmespath.search('"activities-summary".employments."employment-summary"[*]',
-                                         orcid_record) or []
-
-    found_affiliation_ids = set()
-    for index, orcid_affiliation in enumerate(orcid_affiliations):
+    affiliations = []
+    for orcid_affiliation in ORCID_RECORD_MAPPER.employments(orcid_record):
         organization = orcid_affiliation['organization']
         address = organization['address']
 
-        affiliation = Affiliation(
+        affiliations.append(Affiliation(
             affiliation_id=str(orcid_affiliation['put-code']),
             department=orcid_affiliation.get('department-name'),
             organisation=organization['name'],
@@ -74,46 +168,36 @@ def _update_affiliations_from_orcid_record(profile: Profile, orcid_record: dict)
             starts=_convert_orcid_date(orcid_affiliation.get('start-date') or {}),
             ends=_convert_orcid_date(orcid_affiliation.get('end-date') or {}),
             restricted=orcid_affiliation['visibility'] != VISIBILITY_PUBLIC,
-        )
-        profile.add_affiliation(affiliation, index)
-        found_affiliation_ids.add(affiliation.id)
+        ))
 
-    for affiliation in profile.affiliations:
-        if affiliation.id not in found_affiliation_ids:
-            profile.remove_affiliation(affiliation.id)
+    profile.sync_affiliations(affiliations)
 
 
-def _update_email_addresses_from_orcid_record(profile: Profile, orcid_record: dict) -> None:
+def _update_email_addresses_from_orcid_record(profile: Profile, orcid_record: dict) -> bool:
+    """Returns whether the profile has all of the record's email addresses, which it won't if
+    other profiles own any of them."""
     orcid_email_dicts = extract_email_addresses(orcid_record)
-    profiles = SQLAlchemyProfiles(db)
+    owners = SQLAlchemyProfiles(db).get_profile_ids_by_email_address(
+        *[orcid_email['email'] for orcid_email in orcid_email_dicts])
 
-    for index, email_dict in enumerate(orcid_email_dicts):
-        email = email_dict.get('email')
-        try:
-            email_profile = profiles.get_by_email_address(email)
-        except ProfileNotFound:
+    email_addresses = []
+    primary = None
+    skipped = False
+    for orcid_email in orcid_email_dicts:
+        email = orcid_email['email']
+        if owners.get(email, profile.id) != profile.id:
+            LOGGER.error('Profile %s is trying to add email address %s but this email is '
+                         'associated with profile %s which violates unique constraint for email '
+                         'addresses', profile.id, email, owners[email])
+            skipped = True
             continue
+        email_addresses.append(EmailAddress(email, orcid_email['visibility'] != VISIBILITY_PUBLIC))
+        if orcid_email['primary']:
+            primary = email
 
-        if email_profile.id != profile.id:
-            message = ('Profile %s is trying to add email address %s but this '
-                       'email is associated with profile %s which violates '
-                       'unique constraint for email addresses' %
-                       (profile.id, email, email_profile.id))
-            LOGGER.error(message)
-            del orcid_email_dicts[index]
-
-    for email in profile.email_addresses:
-        found = False
-        for orcid_email in orcid_email_dicts:
-            if orcid_email['email'] == email.email:
-                found = True
-                break
-        if not found:
-            profile.remove_email_address(email.email)
+    profile.sync_email_addresses(email_addresses, primary)
 
-    for orcid_email in orcid_email_dicts:
-        profile.add_email_address(orcid_email['email'], orcid_email['primary'],
-                                  orcid_email['visibility'] != VISIBILITY_PUBLIC)
+    return not skipped
 
 
 def _convert_orcid_date(orcid_date: dict) -> Optional[Date]:
@@ -14,11 +14,14 @@ class Config(ABC):
 
     # pylint: disable=invalid-name,too-many-arguments
     def __init__(self, orcid: Dict[str, str], db: str, logging: Dict[str, str],
-                 bus: Dict[str, str], scheme: str, server_name: str = None, **_kwargs) -> None:
+                 bus: Dict[str, str], scheme: str, server_name: str = None,
+                 cache: Dict[str, str] = None, json_backend: str = None, **_kwargs) -> None:
         self.orcid = orcid
         self.SQLALCHEMY_DATABASE_URI = db
         self.logging = logging
         self.bus = bus
+        self.cache = cache or {}
+        self.json_backend = json_backend or None
         self.SERVER_NAME = server_name
         self.PREFERRED_URL_SCHEME = scheme
 
@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Set, Tuple
 
 from elife_bus_sdk.events import ProfileEvent
 from elife_bus_sdk.publishers import EventPublisher
@@ -11,7 +11,8 @@ from profiles.database import db
 from profiles.exceptions import UpdateEventFailure
 from profiles.models import Affiliation, EmailAddress, Profile
 from profiles.orcid import OrcidClient
-from profiles.utilities import catch_exceptions
+from profiles.repositories import SQLAlchemyProfiles
+from profiles.utilities import ResponseCache, catch_exceptions
 
 LOGGER = logging.getLogger(__name__)
 
@@ -57,22 +58,53 @@ def maintain_orcid_webhook(orcid: Dict[str, str], orcid_client: OrcidClient,
     return webhook_maintainer
 
 
+def _changed_profile_ids(changes: List[Tuple[db.Model, str]]) -> Set[str]:
+    """IDs of the profiles that committed changes touch, directly or through their
+    affiliations and email addresses."""
+    ids = set()
+
+    for instance, _ in changes:
+        if isinstance(instance, Profile):
+            ids.add(instance.id)
+        if isinstance(instance, (Affiliation, EmailAddress)):
+            ids.add(instance.profile_id)
+
+    return ids
+
+
+def invalidate_profile_count(profiles: SQLAlchemyProfiles) -> Callable[..., None]:
+    # pylint:disable=unused-argument
+    @catch_exceptions(LOGGER)
+    def count_invalidator(sender: Any, changes: List[Tuple[db.Model, str]]) -> None:
+        if any(isinstance(instance, Profile) and operation != OPERATION_UPDATE
+               for instance, operation in changes):
+            profiles.invalidate_count()
+
+    return count_invalidator
+
+
+def invalidate_profile_responses(response_cache: ResponseCache) -> Callable[..., None]:
+    # pylint:disable=unused-argument
+    @catch_exceptions(LOGGER)
+    def response_invalidator(sender: Any, changes: List[Tuple[db.Model, str]]) -> None:
+        profile_ids = _changed_profile_ids(changes)
+
+        if profile_ids:
+            response_cache.invalidate(profile_ids)
+
+    return response_invalidator
+
+
 def send_update_events(publisher: EventPublisher) -> Callable[..., None]:
     # pylint:disable=unused-argument
     @catch_exceptions(LOGGER)
     def event_handler(sender: Any, changes: List[Tuple[db.Model, str]]) -> None:
-        ids = []
-
         LOGGER.info('Processing event(s)')
 
-        for instance, operation in changes:  # pylint:disable=unused-variable
+        for instance, operation in changes:
             LOGGER.info('Found operation %s %s', operation, instance)
-            if isinstance(instance, Profile):
-                ids.append(instance.id)
-            if isinstance(instance, (Affiliation, EmailAddress)):
-                ids.append(instance.profile_id)
 
-        for profile_id in set(ids):
+        for profile_id in _changed_profile_ids(changes):
             try:
                 LOGGER.info('Sending event for Profile %s', profile_id)
 
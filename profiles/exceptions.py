@@ -1,3 +1,5 @@
+from requests.exceptions import Timeout
+
 from profiles.clients import Client
 
 
@@ -59,10 +61,22 @@ class AffiliationNotFound(Exception):
     pass
 
 
+class CheckpointNotFound(Exception):
+    pass
+
+
+class OrcidDeadlineExceeded(Timeout):
+    pass
+
+
 class OrcidTokenNotFound(Exception):
     pass
 
 
+class OrcidTokenRejected(Exception):
+    pass
+
+
 class ProfileNotFound(Exception):
     pass
 
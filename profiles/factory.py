@@ -8,11 +8,29 @@ from itsdangerous import URLSafeSerializer
 from profiles.api import api, errors, oauth2, ping, webhook
 from profiles.clients import Clients
 from profiles.config import Config
-from profiles.events import maintain_orcid_webhook, send_update_events
+from profiles.events import (
+    invalidate_profile_count,
+    invalidate_profile_responses,
+    maintain_orcid_webhook,
+    send_update_events
+)
 from profiles.exceptions import ClientError, OAuth2Error
 from profiles.database import db, migrate
-from profiles.orcid import OrcidClient
-from profiles.repositories import SQLAlchemyOrcidTokens, SQLAlchemyProfiles
+from profiles.orcid import DEFAULT_CONNECT_TIMEOUT, DEFAULT_DEADLINE, DEFAULT_POOL_CONNECTIONS, \
+    DEFAULT_POOL_MAXSIZE, DEFAULT_READ_TIMEOUT, OrcidClient
+from profiles.repositories import (
+    SQLAlchemyCheckpoints,
+    SQLAlchemyOrcidTokens,
+    SQLAlchemyProfiles,
+    SQLAlchemyWebhookJobs
+)
+from profiles.serializer.encoder import get_encoder
+from profiles.utilities import ResponseCache
+
+DEFAULT_COUNT_TTL = 30
+DEFAULT_RESPONSE_CACHE_SIZE = 1000
+DEFAULT_RESPONSE_TTL = 30
+DEFAULT_WEBHOOK_QUIET_WINDOW = 10
 
 
 def create_app(config: Config, clients: Clients) -> Flask:
@@ -23,11 +41,30 @@ def create_app(config: Config, clients: Clients) -> Flask:
     db.init_app(app)
     migrate.init_app(app, db)
 
-    orcid_client = OrcidClient(config.orcid['api_uri'])
+    orcid_client = OrcidClient(
+        config.orcid['api_uri'],
+        pool_connections=int(config.orcid.get('pool_connections', DEFAULT_POOL_CONNECTIONS)),
+        pool_maxsize=int(config.orcid.get('pool_maxsize', DEFAULT_POOL_MAXSIZE)),
+        pool_block=config.orcid.get('pool_block', 'false').lower() == 'true',
+        keep_alive=config.orcid.get('keep_alive', 'true').lower() == 'true',
+        connect_timeout=float(config.orcid.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=float(config.orcid.get('read_timeout', DEFAULT_READ_TIMEOUT)),
+        deadline=float(config.orcid.get('deadline', DEFAULT_DEADLINE)),
+        record_cache_size=int(config.orcid.get('record_cache_size', 0)),
+    )
     app.orcid_client = orcid_client
 
+    app.checkpoints = SQLAlchemyCheckpoints(db)
     app.orcid_tokens = SQLAlchemyOrcidTokens(db)
-    app.profiles = SQLAlchemyProfiles(db)
+    count_ttl = float(config.cache.get('profile_count_ttl', DEFAULT_COUNT_TTL))
+    app.profiles = SQLAlchemyProfiles(db, count_ttl=count_ttl)
+    app.profile_responses = ResponseCache(
+        int(config.cache.get('profile_response_cache_size', DEFAULT_RESPONSE_CACHE_SIZE)),
+        float(config.cache.get('profile_response_ttl', DEFAULT_RESPONSE_TTL)),
+    )
+    quiet_window = float(config.orcid.get('webhook_quiet_window', DEFAULT_WEBHOOK_QUIET_WINDOW))
+    app.webhook_jobs = SQLAlchemyWebhookJobs(db, quiet_window=quiet_window)
+    webhook_queue = config.orcid.get('webhook_queue', 'false').lower() == 'true'
 
     app.uri_signer = URLSafeSerializer(config.orcid['webhook_key'],
                                        signer_kwargs={'key_derivation': 'hmac',
@@ -36,12 +73,14 @@ def create_app(config: Config, clients: Clients) -> Flask:
     config_bus = dict(config.bus)
     config_bus['env'] = config.name
     publisher = get_publisher(config=config_bus)
-    app.register_blueprint(api.create_blueprint(app.profiles))
+    app.register_blueprint(api.create_blueprint(app.profiles, app.profile_responses,
+                                                get_encoder(config.json_backend)))
     app.register_blueprint(oauth2.create_blueprint(config.orcid, clients, app.profiles, app.orcid_client,
                                                    app.orcid_tokens), url_prefix='/oauth2')
     app.register_blueprint(ping.create_blueprint())
     app.register_blueprint(webhook.create_blueprint(app.profiles, config.orcid, app.orcid_client,
-                                                    app.orcid_tokens, app.uri_signer))
+                                                    app.orcid_tokens, app.uri_signer,
+                                                    app.webhook_jobs if webhook_queue else None))
 
     from werkzeug.exceptions import default_exceptions
     for code in default_exceptions:
@@ -54,5 +93,7 @@ def create_app(config: Config, clients: Clients) -> Flask:
     models_committed.connect(maintain_orcid_webhook(config.orcid, orcid_client, app.uri_signer),
                              weak=False)
     models_committed.connect(send_update_events(publisher=publisher), weak=False)
+    models_committed.connect(invalidate_profile_count(app.profiles), weak=False)
+    models_committed.connect(invalidate_profile_responses(app.profile_responses), weak=False)
 
     return app
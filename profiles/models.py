@@ -1,16 +1,18 @@
 from calendar import monthrange
-from datetime import datetime
-from typing import Any, Iterable, List, Optional
+from datetime import datetime, timezone
+from typing import Any, Iterable, List, Optional, Tuple
 
 from iso3166 import Country
 import pendulum
+from sqlalchemy import and_, event, or_, tuple_
 from sqlalchemy.ext.orderinglist import ordering_list
-from sqlalchemy.orm import composite
-from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.orm import Session, composite
+from sqlalchemy.orm.attributes import InstrumentedAttribute, set_attribute
+from sqlalchemy.sql.elements import BinaryExpression, BooleanClauseList, UnaryExpression
 
 from profiles.database import ISO3166Country, UTCDateTime, db
 from profiles.exceptions import AffiliationNotFound
-from profiles.utilities import guess_index_name
+from profiles.utilities import guess_index_name, utcnow
 
 ID_LENGTH = 8
 
@@ -90,6 +92,51 @@ class OrcidToken(db.Model):
         return '<OrcidToken for %r>' % self.orcid
 
 
+class Checkpoint(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    index_name = db.Column(db.Text(), nullable=False)
+    profile_id = db.Column(db.String(ID_LENGTH), nullable=False)
+    updated_at = db.Column(UTCDateTime, nullable=False)
+
+    def __init__(self, name: str, index_name: str, profile_id: str) -> None:
+        self.name = name
+        self.index_name = index_name
+        self.profile_id = profile_id
+        self.updated_at = utcnow()
+
+    @property
+    def position(self) -> Tuple[str, str]:
+        return self.index_name, self.profile_id
+
+    def __repr__(self) -> str:
+        return '<Checkpoint %r at %r>' % (self.name, self.profile_id)
+
+
+class WebhookJob(db.Model):
+    """A profile waiting to be updated from its ORCID record, following an ORCID webhook."""
+    __table_args__ = (
+        db.Index('ix_webhook_job_not_before', 'not_before'),
+    )
+
+    orcid = db.Column(db.String(19), primary_key=True)
+    enqueued_at = db.Column(UTCDateTime, nullable=False)
+    not_before = db.Column(UTCDateTime, nullable=False)
+    attempts = db.Column(db.Integer(), nullable=False)
+    locked_until = db.Column(UTCDateTime)
+    pings = db.Column(db.Integer(), nullable=False, server_default='1')
+
+    def __init__(self, orcid: str, enqueued_at: datetime = None,
+                 not_before: datetime = None) -> None:
+        self.orcid = orcid
+        self.enqueued_at = enqueued_at or utcnow()
+        self.not_before = not_before or self.enqueued_at
+        self.attempts = 0
+        self.pings = 1
+
+    def __repr__(self) -> str:
+        return '<WebhookJob for %r>' % self.orcid
+
+
 class Name(object):
     def __init__(self, preferred: str, index: str = None) -> None:
         if index is None:
@@ -154,8 +201,12 @@ class Affiliation(db.Model):
     _ends_year = db.Column(db.Integer(), name='ends_year')
     _ends_month = db.Column(db.Integer(), name='ends_month')
     _ends_day = db.Column(db.Integer(), name='ends_day')
+    # The earliest and latest moments that the dates could mean, so that whether an affiliation is
+    # current is a cheap comparison (or an indexed query).
+    starts_at = db.Column(UTCDateTime, index=True)
+    ends_at = db.Column(UTCDateTime, index=True)
     restricted = db.Column(db.Boolean(), nullable=False)
-    profile_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('profile.id'))
+    profile_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('profile.id'), index=True)
     profile = db.relationship('Profile', back_populates='affiliations')
     position = db.Column(db.Integer())
 
@@ -167,8 +218,8 @@ class Affiliation(db.Model):
         self.department = department
         self.organisation = organisation
         self.address = address
-        self._starts = starts
-        self._ends = ends
+        self.set_starts(starts)
+        self.set_ends(ends)
         self.restricted = restricted
 
     @property
@@ -185,21 +236,46 @@ class Affiliation(db.Model):
 
     def set_starts(self, starts: Optional[Date]) -> None:
         self._starts = starts
+        self.starts_at = self.starts.lowest_possible().replace(tzinfo=timezone.utc) \
+            if self.starts else None
 
     def set_ends(self, ends: Optional[Date]) -> None:
         self._ends = ends
+        self.ends_at = self.ends.highest_possible().replace(tzinfo=timezone.utc) \
+            if self.ends else None
+
+    def update(self, affiliation: 'Affiliation') -> None:
+        """Takes on the details of another version of this affiliation."""
+        self.department = affiliation.department
+        self.organisation = affiliation.organisation
+        self.address = affiliation.address
+        self.set_starts(affiliation.starts)
+        self.set_ends(affiliation.ends)
+        self.restricted = affiliation.restricted
 
-    def is_current(self) -> bool:
-        starts = pendulum.instance(self.starts.lowest_possible()) if self.starts else None
-        ends = pendulum.instance(self.ends.highest_possible()) if self.ends else None
+    @classmethod
+    def current(cls, now: datetime = None) -> BooleanClauseList:
+        """Filter for affiliations that are current at `now`."""
+        now = now or utcnow()
 
-        return (not starts or starts.is_past()) and (not ends or ends.is_future())
+        return and_(or_(cls.starts_at.is_(None), cls.starts_at < now),
+                    or_(cls.ends_at.is_(None), cls.ends_at > now))
+
+    def is_current(self, now: datetime = None) -> bool:
+        now = now or utcnow()
+
+        return (self.starts_at is None or self.starts_at < now) and \
+            (self.ends_at is None or self.ends_at > now)
 
     def __repr__(self) -> str:
         return '<Affiliation %r>' % self.id
 
 
 class Profile(db.Model):
+    __table_args__ = (
+        db.Index('ix_profile_index_name_id', 'index_name', 'id'),
+    )
+
     id = db.Column(db.String(ID_LENGTH), primary_key=True)
     name = composite(Name, '_preferred_name', '_index_name')
     _preferred_name = db.Column(db.Text(), name='preferred_name', nullable=False)
@@ -211,6 +287,10 @@ class Profile(db.Model):
     email_addresses = db.relationship('EmailAddress', order_by='EmailAddress.position',
                                       collection_class=ordering_list('position'),
                                       cascade='all, delete-orphan', back_populates='profile')
+    orcid_record_fingerprint = db.Column(db.String(64))
+    # When the profile, or any of its affiliations or email addresses, last changed (see
+    # `_touch_changed_profiles`).
+    updated_at = db.Column(UTCDateTime, index=True)
 
     def __init__(self, profile_id: str, name: Name, orcid: str = None) -> None:
         self.id = profile_id
@@ -218,18 +298,13 @@ class Profile(db.Model):
         self.orcid = orcid
 
     @classmethod
-    def asc(cls) -> UnaryExpression:
-        return cls._index_name.asc()
+    def asc(cls) -> Tuple[UnaryExpression, UnaryExpression]:
+        return cls._index_name.asc(), cls.id.asc()
 
     def add_affiliation(self, affiliation: Affiliation, position: int = 0) -> None:
         for existing_affiliation in self.affiliations:
             if existing_affiliation.id == affiliation.id:
-                existing_affiliation.department = affiliation.department
-                existing_affiliation.organisation = affiliation.organisation
-                existing_affiliation.address = affiliation.address
-                existing_affiliation.set_starts(affiliation.starts)
-                existing_affiliation.set_ends(affiliation.ends)
-                existing_affiliation.restricted = affiliation.restricted
+                existing_affiliation.update(affiliation)
                 if position != existing_affiliation.position:
                     self.affiliations.remove(existing_affiliation)
                     self.affiliations.insert(position, existing_affiliation)
@@ -240,8 +315,21 @@ class Profile(db.Model):
         self.affiliations.reorder()
 
     @classmethod
-    def desc(cls) -> UnaryExpression:
-        return cls._index_name.desc()
+    def after(cls, position: Tuple[str, str], desc: bool = False) -> BinaryExpression:
+        """Filter for profiles sorted after an `(index_name, id)` position.
+
+        Compares the pair as a row value, so it can start a range scan of the
+        `(index_name, id)` index rather than filtering it from the beginning."""
+        columns = tuple_(cls._index_name, cls.id)
+
+        if desc:
+            return columns < tuple_(*position)
+
+        return columns > tuple_(*position)
+
+    @classmethod
+    def desc(cls) -> Tuple[UnaryExpression, UnaryExpression]:
+        return cls._index_name.desc(), cls.id.desc()
 
     def get_affiliation(self, affiliation_id: str) -> Affiliation:
         for affiliation in self.affiliations:
@@ -259,7 +347,8 @@ class Profile(db.Model):
             affiliations = [aff for aff in affiliations if not aff.restricted]
 
         if current_only:
-            affiliations = [aff for aff in affiliations if aff.is_current()]
+            now = utcnow()
+            affiliations = [aff for aff in affiliations if aff.is_current(now)]
 
         return sorted([aff for aff in affiliations], key=lambda k: k.position)
 
@@ -302,20 +391,112 @@ class Profile(db.Model):
                 self.email_addresses.reorder()
                 return
 
+    def sync_affiliations(self, affiliations: List[Affiliation]) -> None:
+        """Makes the profile's affiliations exactly `affiliations`, in that order.
+
+        Affiliations the profile already has are updated rather than replaced, and the rest are
+        removed."""
+        existing = {affiliation.id: affiliation for affiliation in self.affiliations}
+        synced = {}
+        for affiliation in affiliations:
+            current = synced.get(affiliation.id) or existing.get(affiliation.id)
+            if current:
+                current.update(affiliation)
+            synced[affiliation.id] = current or affiliation
+
+        # replaces the whole collection, which stays an ordering list
+        set_attribute(self, 'affiliations', list(synced.values()))
+        self.affiliations.reorder()
+
+    def sync_email_addresses(self, email_addresses: List['EmailAddress'],
+                             primary: str = None) -> None:
+        """Makes the profile's email addresses exactly `email_addresses`, with `primary` first.
+
+        Email addresses the profile already has are updated and keep their places, new ones
+        follow them, and the rest are removed."""
+        existing = {email_address.email: email_address for email_address in self.email_addresses}
+        synced = {}
+        for email_address in email_addresses:
+            current = synced.get(email_address.email) or existing.get(email_address.email)
+            if current:
+                current.restricted = email_address.restricted
+            synced[email_address.email] = current or email_address
+
+        ordered = [email_address for email_address in self.email_addresses
+                   if email_address.email in synced]
+        ordered += [email_address for email, email_address in synced.items()
+                    if email not in existing]
+        if primary in synced:
+            ordered.remove(synced[primary])
+            ordered.insert(0, synced[primary])
+
+        set_attribute(self, 'email_addresses', ordered)
+        self.email_addresses.reorder()
+
+    @classmethod
+    def snippet_columns(cls) -> Tuple[InstrumentedAttribute, ...]:
+        """Columns to select to build a `ProfileSnippet`, in constructor order."""
+        return cls.id, cls._preferred_name, cls._index_name, cls.orcid
+
     def __repr__(self) -> str:
         return '<Profile %r>' % self.id
 
 
+class ProfileSnippet(object):
+    """Read-only view of the columns a profile list needs, without loading the profile."""
+    __slots__ = ('id', 'preferred_name', 'index_name', 'orcid')
+
+    def __init__(self, profile_id: str, preferred_name: str, index_name: str,
+                 orcid: str = None) -> None:
+        self.id = profile_id
+        self.preferred_name = preferred_name
+        self.index_name = index_name
+        self.orcid = orcid
+
+    @property
+    def position(self) -> Tuple[str, str]:
+        """Where this profile sits in the list, for carrying on after it (see `Profile.after`)."""
+        return self.index_name, self.id
+
+    def __repr__(self) -> str:
+        return '<ProfileSnippet %r>' % self.id
+
+
 class EmailAddress(db.Model):
     email = db.Column(db.Text(), primary_key=True)
+    normalized_email = db.Column(db.Text(), index=True)
     restricted = db.Column(db.Boolean(), nullable=False)
-    profile_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('profile.id'))
+    profile_id = db.Column(db.String(ID_LENGTH), db.ForeignKey('profile.id'), index=True)
     profile = db.relationship('Profile', back_populates='email_addresses')
     position = db.Column(db.Integer())
 
     def __init__(self, email: str, restricted: bool = False) -> None:
         self.email = email
+        self.normalized_email = self.normalize(email)
         self.restricted = restricted
 
+    @staticmethod
+    def normalize(email: str) -> str:
+        """What email addresses are compared on, so that `Foo@x.org` finds `foo@x.org`."""
+        return email.lower()
+
     def __repr__(self) -> str:
         return '<EmailAddress %r>' % self.email
+
+
+# pylint:disable=unused-argument
+@event.listens_for(Session, 'before_flush')
+def _touch_changed_profiles(session: Session, flush_context, instances) -> None:
+    changed = set()
+
+    for instance in session.new | session.dirty | session.deleted:
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+        if isinstance(instance, Profile):
+            changed.add(instance)
+        elif isinstance(instance, (Affiliation, EmailAddress)) and instance.profile:
+            changed.add(instance.profile)
+
+    now = utcnow()
+    for profile in changed - set(session.deleted):
+        profile.updated_at = now
@@ -1,33 +1,319 @@
+import copy
 import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.cookiejar import DefaultCookiePolicy
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 from urllib.parse import quote
-from urllib3.util.retry import Retry
+
+import jmespath
 import requests
+from urllib3.util.retry import Retry
+
+from profiles.exceptions import OrcidDeadlineExceeded
 
 API_VERSION = 'v2.1'
 LOGGER = logging.getLogger(__name__)
 
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+MAX_RETRIES = 5
+
+# uWSGI kills workers after 10 seconds (`harakiri` in config/uwsgi.ini), so by default a
+# request and all of its retries have to be over well before then.
+DEFAULT_CONNECT_TIMEOUT = 2
+DEFAULT_READ_TIMEOUT = 3
+DEFAULT_DEADLINE = 8
+
+# ORCID's public API allows a sustained 24 requests per second (bursts of 40) per client.
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 12
+DEFAULT_FETCH_ATTEMPTS = 3
+QUEUED_PER_WORKER = 2
+
 VISIBILITY_PUBLIC = 'PUBLIC'
 VISIBILITY_LIMITED = 'LIMITED'
 VISIBILITY_PRIVATE = 'PRIVATE'
 
+# How `update_profile_from_orcid` fetches records (`[orcid] record_mode`): the whole record, or
+# only the sections that profiles are updated from.
+RECORD_MODE_FULL = 'full'
+RECORD_MODE_SECTIONS = 'sections'
+
+RECORD_LAST_MODIFIED = jmespath.compile('history."last-modified-date".value')
+
+# When requests made by this thread share a deadline (`OrcidClient.shared_deadline`), when it
+# started.
+_SHARED_DEADLINE = threading.local()
+
+
+def _shared_deadline_started() -> Optional[float]:
+    return getattr(_SHARED_DEADLINE, 'started', None)
+
+
+class CachedRecord(object):
+    """An ORCID record along with what's needed to ask ORCID whether it has changed since."""
+    __slots__ = ('record', 'etag', 'last_modified')
+
+    def __init__(self, record: dict, etag: str = None, last_modified: str = None) -> None:
+        self.record = record
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def from_response(cls, response: requests.Response, record: dict) -> 'CachedRecord':
+        last_modified = response.headers.get('Last-Modified')
+
+        if not last_modified:
+            # The record itself says when it last changed (in milliseconds).
+            modified_at = RECORD_LAST_MODIFIED.search(record)
+            if modified_at:
+                last_modified = formatdate(int(modified_at) / 1000, usegmt=True)
+
+        return cls(record, response.headers.get('ETag'), last_modified)
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+
+
+class RecordCache(object):
+    """Thread-safe store of the `size` most recently used `CachedRecord`s."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[CachedRecord]:
+        with self._lock:
+            cached = self._records.get(key)
+            if cached is not None:
+                self._records.move_to_end(key)
+
+            return cached
+
+    def put(self, key: Tuple[str, str], cached: CachedRecord) -> None:
+        with self._lock:
+            self._records[key] = cached
+            self._records.move_to_end(key)
+            while len(self._records) > self.size:
+                self._records.popitem(last=False)
+
+
+class RateLimiter(object):
+    """Spaces out `acquire()` calls from any number of threads to at most `rate` per second.
+
+    `pause()` holds every thread back, eg while the server is asking clients to slow down."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class DeadlineRetry(Retry):
+    """Retry policy that gives up once waiting for and making another attempt would overrun
+    a total `deadline` (in seconds) measured from `started`."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, *args, deadline: float = None, attempt_timeout: float = 0,
+                 started: float = None, rate_limiter: RateLimiter = None, **kwargs) -> None:
+        super(DeadlineRetry, self).__init__(*args, **kwargs)
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.started = started
+        self.rate_limiter = rate_limiter
+
+    def new(self, **kw) -> 'DeadlineRetry':
+        kw.setdefault('deadline', self.deadline)
+        kw.setdefault('attempt_timeout', self.attempt_timeout)
+        kw.setdefault('started', self.started)
+        kw.setdefault('rate_limiter', self.rate_limiter)
+
+        return super(DeadlineRetry, self).new(**kw)
+
+    # pylint: disable=arguments-differ
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None,
+                  _stacktrace=None) -> 'DeadlineRetry':
+        retry = super(DeadlineRetry, self).increment(method, url, response, error, _pool,
+                                                     _stacktrace)
+
+        wait = retry.get_backoff_time()
+        if response is not None and retry.respect_retry_after_header:
+            wait = retry.get_retry_after(response) or wait
+
+        if self.rate_limiter is not None and response is not None and response.status == 429:
+            # Being told to back off applies to every thread sharing the limit, not just this one.
+            self.rate_limiter.pause(wait)
+
+        if self.deadline is None or self.started is None:
+            return retry
+
+        elapsed = time.monotonic() - self.started
+        if elapsed + wait + self.attempt_timeout > self.deadline:
+            if response is not None:
+                response.drain_conn()
+            raise OrcidDeadlineExceeded('Deadline of {}s exhausted after {} attempt(s) in {:.2f}s'
+                                        .format(self.deadline, len(retry.history), elapsed))
+
+        return retry
+
+
+class DeadlineHTTPAdapter(requests.adapters.HTTPAdapter):
+    """Starts the deadline of a `DeadlineRetry` policy when each request is sent, unless the
+    request is sharing one that started earlier."""
+
+    @property
+    def max_retries(self) -> Retry:
+        if isinstance(self._max_retries, DeadlineRetry):
+            started = _shared_deadline_started()
+            return self._max_retries.new(
+                started=time.monotonic() if started is None else started)
+
+        return self._max_retries
+
+    @max_retries.setter
+    def max_retries(self, max_retries: Retry) -> None:
+        self._max_retries = max_retries
+
 
 class OrcidClient(object):
-    def __init__(self, api_uri: str) -> None:
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, api_uri: str, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE, pool_block: bool = False,
+                 keep_alive: bool = True, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 deadline: float = DEFAULT_DEADLINE, record_cache_size: int = 0) -> None:
+        """`pool_connections` is the number of hosts to keep pools for, `pool_maxsize` the
+        number of connections kept open per host, and `pool_block` whether a thread waits
+        for a free connection rather than opening a throwaway one above that limit.
+
+        Each attempt may take `connect_timeout` + `read_timeout` seconds; retries stop once
+        another one wouldn't fit inside `deadline` seconds from the start of the request.
+
+        With a `record_cache_size`, that many records are kept and only downloaded again if ORCID
+        says they have changed. Records may then be shared between callers, so mustn't be
+        modified."""
         self.api_uri = api_uri
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.record_cache = RecordCache(record_cache_size) if record_cache_size else None
+        self.rate_limiter = None
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def rate_limited(self, rate: float) -> 'OrcidClient':
+        """Copy of this client whose requests, from any thread, are limited to `rate` per
+        second, and which all back off when ORCID responds with a HTTP 429."""
+        client = copy.copy(self)
+        client.rate_limiter = RateLimiter(rate)
+        client._session = None
+        client._session_pid = None
+        client._session_lock = threading.Lock()
+
+        return client
 
     def get_record(self, orcid: str, access_token: str) -> dict:
-        LOGGER.debug('Requesting ORCID record for %s', format(orcid))
+        return self._get_document(orcid, 'record', access_token)
+
+    def get_person(self, orcid: str, access_token: str) -> dict:
+        return self._get_document(orcid, 'person', access_token)
+
+    def get_employments(self, orcid: str, access_token: str) -> dict:
+        return self._get_document(orcid, 'employments', access_token)
+
+    def get_emails(self, orcid: str, access_token: str) -> dict:
+        return self._get_document(orcid, 'email', access_token)
+
+    def get_partial_record(self, orcid: str, access_token: str) -> dict:
+        """The parts of an ORCID record that profiles are updated from, in the same shape as
+        `get_record`, without downloading works, fundings, peer reviews and so on.
+
+        Both sections are fetched inside a single deadline, so this takes no longer than
+        `get_record` can."""
+        with self.shared_deadline():
+            return {
+                'path': '/{}'.format(orcid),
+                'person': self.get_person(orcid, access_token),
+                'activities-summary': {
+                    'employments': self.get_employments(orcid, access_token),
+                },
+            }
+
+    @staticmethod
+    @contextmanager
+    def shared_deadline() -> Iterator[None]:
+        """Requests made by this thread inside the block share one deadline, starting now,
+        rather than each having their own."""
+        if _shared_deadline_started() is not None:
+            yield
+            return
+
+        _SHARED_DEADLINE.started = time.monotonic()
+        try:
+            yield
+        finally:
+            _SHARED_DEADLINE.started = None
+
+    def _get_document(self, orcid: str, section: str, access_token: str) -> dict:
+        LOGGER.debug('Requesting ORCID %s for %s', section, orcid)
+
+        path = '{}/{}/{}'.format(API_VERSION, orcid, section)
+        cached = self.record_cache.get((path, access_token)) if self.record_cache else None
 
         try:
-            response = self._get_request('{}/{}/record'.format(API_VERSION, orcid), access_token)
+            response = self._get_request(path, access_token,
+                                         cached.validators() if cached else None)
         except requests.RequestException as exception:
-            LOGGER.warning('Failed to load ORCID record for %s (%s)', orcid, str(exception))
+            LOGGER.warning('Failed to load ORCID %s for %s (%s)', section, orcid, str(exception))
             raise exception
 
-        LOGGER.debug('Received ORCID record for %s', orcid)
+        if cached and response.status_code == 304:
+            LOGGER.debug('ORCID %s for %s has not been modified', section, orcid)
+            return cached.record
 
-        return json.loads(response.text)
+        LOGGER.debug('Received ORCID %s for %s', section, orcid)
+
+        record = json.loads(response.text)
+
+        if self.record_cache:
+            cached = CachedRecord.from_response(response, record)
+            if cached.validators():
+                self.record_cache.put((path, access_token), cached)
+
+        return record
 
     def set_webhook(self, orcid: str, webhook: str, access_token: str) -> None:
         LOGGER.debug('Setting ORCID webhook %s for %s', webhook, orcid)
@@ -55,9 +341,13 @@ class OrcidClient(object):
 
         LOGGER.debug('Removed ORCID webhook %s for %s', webhook, orcid)
 
-    def _get_request(self, path: str, access_token: str) -> requests.Response:
-        headers = {'Accept': 'application/orcid+json',
-                   'User-Agent': "profiles/master (https://github.com/elifesciences/profiles)"}
+    def _get_request(self, path: str, access_token: str,
+                     headers: Dict[str, str] = None) -> requests.Response:
+        headers = dict(headers or {})
+        headers.update({
+            'Accept': 'application/orcid+json',
+            'User-Agent': "profiles/master (https://github.com/elifesciences/profiles)",
+        })
 
         return self._request('get', path, access_token, headers)
 
@@ -67,13 +357,71 @@ class OrcidClient(object):
 
         uri = '{}/{}'.format(self.api_uri, path)
         headers['Authorization'] = 'Bearer ' + access_token
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
 
-        MAX_RETRIES = 5
+        timeout = self._timeout()
+        if timeout is None:
+            LOGGER.warning('%s %s: total deadline exhausted before sending', method.upper(), path)
+            raise OrcidDeadlineExceeded('Deadline of {}s exhausted before sending'
+                                        .format(self.deadline))
 
+        try:
+            response = self._get_session().request(method, uri, headers=headers, timeout=timeout)
+        except requests.ConnectTimeout:
+            LOGGER.warning('%s %s: connect timeout of %ss exhausted', method.upper(), path,
+                           self.connect_timeout)
+            raise
+        except requests.ConnectionError as exception:
+            # requests wraps anything raised by the retry policy inside urllib3.
+            if exception.args and isinstance(exception.args[0], OrcidDeadlineExceeded):
+                LOGGER.warning('%s %s: total deadline exhausted (%s)', method.upper(), path,
+                               exception.args[0])
+                raise exception.args[0] from exception
+            raise
+        except requests.ReadTimeout:
+            LOGGER.warning('%s %s: read timeout of %ss exhausted', method.upper(), path,
+                           self.read_timeout)
+            raise
+
+        response.raise_for_status()
+
+        return response
+
+    def _timeout(self) -> Optional[Tuple[float, float]]:
+        """Connect and read timeouts for the next attempt, cut down to what's left of a shared
+        deadline; `None` if there's nothing left."""
+        started = _shared_deadline_started()
+        if started is None or self.deadline is None:
+            return self.connect_timeout, self.read_timeout
+
+        remaining = self.deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            return None
+
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def _get_session(self) -> requests.Session:
+        # uWSGI forks its workers after the app (and this client) has been created, so each
+        # process opens its own pool rather than sharing sockets inherited from the master.
+        pid = os.getpid()
+
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    self._session = self._create_session()
+                    self._session_pid = pid
+
+        return self._session
+
+    def _create_session(self) -> requests.Session:
         # lsh@2023-07-28: handle network errors better.
         # - https://urllib3.readthedocs.io/en/stable/user-guide.html#retrying-requests
         # - https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html
-        max_retries_obj = Retry(**{
+        max_retries_obj = DeadlineRetry(**{
             'total': MAX_RETRIES,
             'connect': MAX_RETRIES,
             'read': MAX_RETRIES,
@@ -85,12 +433,70 @@ class OrcidClient(object):
             # {backoff factor} * (2 ** {number of previous retries})
             # 0.5 => 1.0, 2.0, 4.0, 8.0, 16.0
             'backoff_factor': 0.5,
+            'deadline': self.deadline,
+            'attempt_timeout': self.connect_timeout + self.read_timeout,
+            'rate_limiter': self.rate_limiter,
         })
-        adaptor = requests.adapters.HTTPAdapter(max_retries=max_retries_obj)
+        adaptor = DeadlineHTTPAdapter(max_retries=max_retries_obj,
+                                      pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize,
+                                      pool_block=self.pool_block)
         session = requests.Session()
         session.mount('https://', adaptor)
+        session.mount('http://', adaptor)
+        # The session is shared between threads, so don't let responses modify its state.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
 
-        response = session.request(method, uri, headers=headers)
-        response.raise_for_status()
+        return session
 
-        return response
+
+class BulkRecordFetcher(object):
+    """Fetches many ORCID records at once, using up to `workers` threads.
+
+    Requests that fail on the network are tried again up to `attempts` times in total; HTTP
+    errors are returned as-is."""
+
+    def __init__(self, orcid_client: OrcidClient, access_token: str,
+                 workers: int = DEFAULT_WORKERS, attempts: int = DEFAULT_FETCH_ATTEMPTS) -> None:
+        self.orcid_client = orcid_client
+        self.access_token = access_token
+        self.workers = workers
+        self.attempts = attempts
+
+    def fetch(self, orcids: Iterable[str]) \
+            -> Iterator[Tuple[str, Optional[dict], Optional[Exception]]]:
+        """Yields `(orcid, record, exception)` for each ORCID iD, in the order given.
+
+        Only a few requests are queued up for each worker, and those are cancelled if this
+        stops early (on a `KeyboardInterrupt`, say), so that it doesn't wait for the rest."""
+        orcids = iter(orcids)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for orcid in islice(orcids, self.workers * QUEUED_PER_WORKER):
+                    pending.append(executor.submit(self._fetch, orcid))
+
+                while pending:
+                    result = pending.popleft().result()
+                    for orcid in islice(orcids, 1):
+                        pending.append(executor.submit(self._fetch, orcid))
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _fetch(self, orcid: str) -> Tuple[str, Optional[dict], Optional[Exception]]:
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return orcid, self.orcid_client.get_record(orcid, self.access_token), None
+            except requests.HTTPError as exception:
+                return orcid, None, exception
+            except requests.RequestException as exception:
+                if attempt == self.attempts:
+                    return orcid, None, exception
+                LOGGER.info('Attempt %d of %d for ORCID record %s failed (%s)', attempt,
+                            self.attempts, orcid, exception)
+            # pylint: disable=broad-except
+            except Exception as exception:
+                return orcid, None, exception
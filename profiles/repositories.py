@@ -1,21 +1,70 @@
 import collections
 import logging
 import string
+import time
 from abc import abstractmethod
-from typing import Callable, List
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from flask_sqlalchemy import SQLAlchemy
 from retrying import retry
+from sqlalchemy import and_, case, func, or_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm.exc import FlushError, NoResultFound
-
-from profiles.exceptions import OrcidTokenNotFound, ProfileNotFound
-from profiles.models import EmailAddress, ID_LENGTH, OrcidToken, Profile
+from sqlalchemy.orm import Query, joinedload, selectinload
+from sqlalchemy.orm.exc import FlushError, MultipleResultsFound, NoResultFound
+
+from profiles.exceptions import CheckpointNotFound, OrcidTokenNotFound, ProfileNotFound
+from profiles.models import (
+    Affiliation,
+    Checkpoint,
+    EmailAddress,
+    ID_LENGTH,
+    OrcidToken,
+    Profile,
+    ProfileSnippet,
+    WebhookJob
+)
 from profiles.types import CanBeCleared
-from profiles.utilities import generate_random_string
+from profiles.utilities import generate_random_string, utcnow
 
 LOGGER = logging.getLogger(__name__)
 
+# How many due jobs a worker looks at when claiming one, so that workers claiming at the same
+# time can fall back to another job rather than all fighting over the oldest.
+CLAIM_CANDIDATES = 10
+
+
+class Checkpoints(CanBeCleared):
+    @abstractmethod
+    def get(self, name: str) -> Checkpoint:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, name: str, position: Tuple[str, str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, name: str) -> None:
+        raise NotImplementedError
+
+
+class WebhookJobs(CanBeCleared):
+    @abstractmethod
+    def enqueue(self, orcid: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, lease: float) -> Optional[WebhookJob]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, job: WebhookJob) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def retry(self, job: WebhookJob, delay: float) -> None:
+        raise NotImplementedError
+
 
 class OrcidTokens(CanBeCleared):
     @abstractmethod
@@ -37,29 +86,196 @@ class Profiles(CanBeCleared, collections.Sized):
         raise NotImplementedError
 
     @abstractmethod
-    def get(self, profile_id: str) -> Profile:
+    def get(self, profile_id: str, eager: bool = False) -> Profile:
         raise NotImplementedError
 
     @abstractmethod
-    def get_by_orcid(self, orcid: str) -> Profile:
+    def get_many(self, profile_ids: Iterable[str], eager: bool = False) -> List[Profile]:
+        """The profiles that exist out of `profile_ids`, in no particular order."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_orcid(self, orcid: str, eager: bool = False) -> Profile:
         raise NotImplementedError
 
     @abstractmethod
     def get_by_email_address(self, *email_addresses: str) -> Profile:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_profile_ids_by_email_address(self, *email_addresses: str,
+                                         include_restricted: bool = True) -> Dict[str, str]:
+        """Which profile, if any, each of the email addresses belongs to."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_profile_ids_by_orcid(self, *orcids: str) -> Dict[str, str]:
+        """Which profile, if any, each of the ORCID iDs belongs to."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_updated_at(self, profile_id: str) -> Optional[datetime]:
+        """When the profile last changed, without loading it."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many_updated_at(self, profile_ids: Iterable[str]) -> Dict[str, Optional[datetime]]:
+        """When each of the profiles that exist last changed, without loading them."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def last_updated_at(self) -> Optional[datetime]:
+        """When any profile last changed."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_and_last_updated_at(self) -> Tuple[int, Optional[datetime]]:
+        """How many profiles there are, counted afresh, and when any last changed."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_current_affiliations(self, profile_id: str,
+                                 include_restricted: bool = False) -> List[Affiliation]:
+        raise NotImplementedError
+
     @abstractmethod
     def next_id(self) -> str:
         raise NotImplementedError
 
     @abstractmethod
-    def list(self, limit: int = None, offset: int = 0, desc: bool = False) -> List[Profile]:
+    def list(self, limit: int = None, offset: int = 0, desc: bool = False,
+             after: Tuple[str, str] = None, eager: bool = False) -> List[Profile]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_snippets(self, limit: int = None, offset: int = 0, desc: bool = False,
+                      after: Tuple[str, str] = None) -> List[ProfileSnippet]:
         raise NotImplementedError
 
+    def iterate_snippets(self, batch_size: int, after: Tuple[str, str] = None) \
+            -> Iterator[List[ProfileSnippet]]:
+        """Yields every profile (after `after`) in ascending order, `batch_size` at a time.
+
+        Each batch is a separate query that seeks past the previous one, so only one batch is
+        held in memory and the caller is free to commit between batches."""
+        while True:
+            batch = self.list_snippets(batch_size, desc=False, after=after)
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+            after = batch[-1].position
+
     @abstractmethod
     def remove(self, orcid: str) -> None:
         raise NotImplementedError
 
+class SQLAlchemyCheckpoints(Checkpoints):
+    def __init__(self, db: SQLAlchemy) -> None:
+        self.db = db
+
+    def get(self, name: str) -> Checkpoint:
+        try:
+            return self.db.session.query(Checkpoint).filter_by(name=name).one()
+        except NoResultFound as exception:
+            raise CheckpointNotFound('Checkpoint {} not found'.format(name)) from exception
+
+    def save(self, name: str, position: Tuple[str, str]) -> None:
+        self.db.session.merge(Checkpoint(name, *position))
+
+    def clear(self) -> None:
+        self.db.session.query(Checkpoint).delete()
+
+    def remove(self, name: str) -> None:
+        self.db.session.query(Checkpoint).filter_by(name=name).delete()
+
+
+class SQLAlchemyWebhookJobs(WebhookJobs):
+    def __init__(self, db: SQLAlchemy, quiet_window: float = 0) -> None:
+        """`quiet_window` holds newly queued jobs back for that many seconds, so that further
+        pings for the same ORCID iD in the meantime are handled by the same job."""
+        self.db = db
+        self.quiet_window = quiet_window
+
+    def enqueue(self, orcid: str) -> None:
+        now = utcnow()
+        due = now + timedelta(seconds=self.quiet_window)
+
+        if self._requeue(orcid, now, due):
+            return
+
+        try:
+            with self.db.session.begin_nested():
+                self.db.session.add(WebhookJob(orcid, now, due))
+        except IntegrityError:
+            # Another request queued it in the meantime.
+            self._requeue(orcid, now, due)
+
+    def claim(self, lease: float) -> Optional[WebhookJob]:
+        """Leases the next due job for `lease` seconds, after which it's due again unless it
+        has been completed or retried. The job is detached from the session."""
+        now = utcnow()
+        due = and_(WebhookJob.not_before <= now,
+                   or_(WebhookJob.locked_until.is_(None), WebhookJob.locked_until <= now))
+
+        candidates = self.db.session.query(WebhookJob.orcid).filter(due) \
+            .order_by(WebhookJob.not_before).limit(CLAIM_CANDIDATES).all()
+
+        for orcid, in candidates:
+            # Only one worker's update can match while the job is still due.
+            claimed = self.db.session.query(WebhookJob) \
+                .filter(WebhookJob.orcid == orcid, due) \
+                .update({WebhookJob.locked_until: now + timedelta(seconds=lease),
+                         WebhookJob.attempts: WebhookJob.attempts + 1},
+                        synchronize_session=False)
+
+            if claimed:
+                job = self.db.session.query(WebhookJob).filter_by(orcid=orcid) \
+                    .populate_existing().one()
+                self.db.session.expunge(job)
+
+                return job
+
+        return None
+
+    def complete(self, job: WebhookJob) -> None:
+        self.db.session.query(WebhookJob) \
+            .filter_by(orcid=job.orcid, enqueued_at=job.enqueued_at) \
+            .delete(synchronize_session=False)
+        # Otherwise it was queued again while leased, and only the newer pings are outstanding.
+        self.db.session.query(WebhookJob).filter_by(orcid=job.orcid) \
+            .update({WebhookJob.pings: WebhookJob.pings - job.pings},
+                    synchronize_session=False)
+        self._release(job)
+
+    def retry(self, job: WebhookJob, delay: float) -> None:
+        self.db.session.query(WebhookJob) \
+            .filter_by(orcid=job.orcid, enqueued_at=job.enqueued_at) \
+            .update({WebhookJob.not_before: utcnow() + timedelta(seconds=delay)},
+                    synchronize_session=False)
+        self._release(job)
+
+    def clear(self) -> None:
+        self.db.session.query(WebhookJob).delete()
+
+    def _requeue(self, orcid: str, now: datetime, due: datetime) -> bool:
+        # Moving `enqueued_at` on means a worker that's already handling an earlier ping
+        # doesn't complete the job, so the latest version of the record is always fetched.
+        # A job that's already due (or waiting out its quiet window) stays that way; one
+        # backing off after a failure is brought forward.
+        not_before = case([(WebhookJob.not_before > due, due)], else_=WebhookJob.not_before)
+
+        return bool(self.db.session.query(WebhookJob).filter_by(orcid=orcid)
+                    .update({WebhookJob.enqueued_at: now, WebhookJob.not_before: not_before,
+                             WebhookJob.attempts: 0, WebhookJob.pings: WebhookJob.pings + 1},
+                            synchronize_session=False))
+
+    def _release(self, job: WebhookJob) -> None:
+        # If the job was queued again while leased, it's due straight away.
+        self.db.session.query(WebhookJob).filter_by(orcid=job.orcid) \
+            .update({WebhookJob.locked_until: None}, synchronize_session=False)
+
+
 class SQLAlchemyOrcidTokens(OrcidTokens):
     def __init__(self, db: SQLAlchemy) -> None:
         self.db = db
@@ -87,7 +303,10 @@ class SQLAlchemyOrcidTokens(OrcidTokens):
 
 
 class SQLAlchemyProfiles(Profiles):
-    def __init__(self, db: SQLAlchemy, next_id_generator: Callable[[], str] = None) -> None:
+    def __init__(self, db: SQLAlchemy, next_id_generator: Callable[[], str] = None,
+                 count_ttl: float = None) -> None:
+        """`count_ttl` enables reusing the number of profiles for that many seconds, or until
+        `invalidate_count()` is called (e.g. when profiles are committed)."""
         if next_id_generator is None:
             def generate_id():
                 return generate_random_string(ID_LENGTH, string.ascii_lowercase + string.digits)
@@ -96,6 +315,9 @@ class SQLAlchemyProfiles(Profiles):
 
         self.db = db
         self._next_id_generator = next_id_generator
+        self._count_ttl = count_ttl
+        self._count: Optional[int] = None
+        self._counted_at = 0.0
 
     def add(self, profile: Profile) -> Profile:
         self.db.session.begin_nested()
@@ -125,17 +347,25 @@ class SQLAlchemyProfiles(Profiles):
 
         return profile
 
-    def get(self, profile_id: str) -> Profile:
+    def get(self, profile_id: str, eager: bool = False) -> Profile:
         try:
-            return self.db.session.query(Profile).filter_by(id=profile_id).one()
+            return self._query(eager, single=True).filter_by(id=profile_id).one()
         except NoResultFound as exception:
             msg = 'Profile with ID {} not found'.format(profile_id)
             LOGGER.info(msg=msg)
             raise ProfileNotFound(msg) from exception
 
-    def get_by_orcid(self, orcid: str) -> Profile:
+    def get_many(self, profile_ids: Iterable[str], eager: bool = False) -> List[Profile]:
+        profile_ids = list(profile_ids)
+        if not profile_ids:
+            return []
+
+        return self._query(eager) \
+            .filter(Profile.id.in_(profile_ids)).all()
+
+    def get_by_orcid(self, orcid: str, eager: bool = False) -> Profile:
         try:
-            return self.db.session.query(Profile).filter_by(orcid=orcid).one()
+            return self._query(eager, single=True).filter_by(orcid=orcid).one()
         except NoResultFound as exception:
             msg = 'Profile with ORCID {} not found'.format(orcid)
             LOGGER.info(msg=msg)
@@ -145,13 +375,88 @@ class SQLAlchemyProfiles(Profiles):
         if not email_addresses:
             raise ProfileNotFound('No email address(es) provided')
 
+        normalized = [EmailAddress.normalize(email) for email in email_addresses]
+        query = self.db.session.query(Profile).join(EmailAddress) \
+            .filter(EmailAddress.normalized_email.in_(normalized))
+
         try:
-            return self.db.session.query(Profile).join(EmailAddress) \
-                .filter(EmailAddress.email.in_(email_addresses)).one()
+            return query.one()
         except NoResultFound as exception:
             msg = 'Profile with email address(es) {} not found'.format(email_addresses)
             LOGGER.info(msg=msg)
             raise ProfileNotFound(msg) from exception
+        except MultipleResultsFound:
+            LOGGER.warning('Email address(es) %s belong to more than one profile',
+                           email_addresses)
+            return query.order_by(EmailAddress.email.in_(email_addresses).desc(),
+                                  Profile.id).first()
+
+    def get_profile_ids_by_email_address(self, *email_addresses: str,
+                                         include_restricted: bool = True) -> Dict[str, str]:
+        if not email_addresses:
+            return {}
+
+        normalized = {email: EmailAddress.normalize(email) for email in email_addresses}
+        query = self.db.session.query(EmailAddress.email, EmailAddress.normalized_email,
+                                      EmailAddress.profile_id) \
+            .filter(EmailAddress.normalized_email.in_(set(normalized.values())))
+
+        if not include_restricted:
+            query = query.filter(EmailAddress.restricted.is_(False))
+
+        # Profiles can have addresses that differ only in case, so an exact match wins.
+        exact = {}
+        ignoring_case = {}
+        for email, normalized_email, profile_id in query.order_by(EmailAddress.email):
+            exact[email] = profile_id
+            ignoring_case.setdefault(normalized_email, profile_id)
+
+        owners = {}
+        for email in email_addresses:
+            profile_id = exact.get(email) or ignoring_case.get(normalized[email])
+            if profile_id:
+                owners[email] = profile_id
+
+        return owners
+
+    def get_profile_ids_by_orcid(self, *orcids: str) -> Dict[str, str]:
+        if not orcids:
+            return {}
+
+        return dict(self.db.session.query(Profile.orcid, Profile.id)
+                    .filter(Profile.orcid.in_(orcids)))
+
+    def get_updated_at(self, profile_id: str) -> Optional[datetime]:
+        try:
+            return self.db.session.query(Profile.updated_at).filter_by(id=profile_id).one()[0]
+        except NoResultFound as exception:
+            msg = 'Profile with ID {} not found'.format(profile_id)
+            LOGGER.info(msg=msg)
+            raise ProfileNotFound(msg) from exception
+
+    def get_many_updated_at(self, profile_ids: Iterable[str]) -> Dict[str, Optional[datetime]]:
+        profile_ids = list(profile_ids)
+        if not profile_ids:
+            return {}
+
+        return dict(self.db.session.query(Profile.id, Profile.updated_at)
+                    .filter(Profile.id.in_(profile_ids)))
+
+    def last_updated_at(self) -> Optional[datetime]:
+        return self.db.session.query(func.max(Profile.updated_at)).scalar()
+
+    def count_and_last_updated_at(self) -> Tuple[int, Optional[datetime]]:
+        return self.db.session.query(func.count(Profile.id), func.max(Profile.updated_at)).one()
+
+    def get_current_affiliations(self, profile_id: str,
+                                 include_restricted: bool = False) -> List[Affiliation]:
+        query = self.db.session.query(Affiliation) \
+            .filter(Affiliation.profile_id == profile_id, Affiliation.current())
+
+        if not include_restricted:
+            query = query.filter(Affiliation.restricted.is_(False))
+
+        return query.order_by(Affiliation.position).all()
 
     @retry(stop_max_attempt_number=10)
     def next_id(self) -> str:
@@ -162,16 +467,18 @@ class SQLAlchemyProfiles(Profiles):
 
         return profile_id
 
-    def list(self, limit: int = None, offset: int = 0, desc: bool = True) -> List[Profile]:
+    def list(self, limit: int = None, offset: int = 0, desc: bool = True,
+             after: Tuple[str, str] = None, eager: bool = False) -> List[Profile]:
 
-        query = self.db.session.query(Profile)
+        query = self._query(eager)
 
-        if desc:
-            query = query.order_by(Profile.desc())
-        else:
-            query = query.order_by(Profile.asc())
+        return self._slice(query, limit, offset, desc, after).all()
 
-        return query.limit(limit).offset(offset).all()
+    def list_snippets(self, limit: int = None, offset: int = 0, desc: bool = True,
+                      after: Tuple[str, str] = None) -> List[ProfileSnippet]:
+        query = self.db.session.query(*Profile.snippet_columns())
+
+        return [ProfileSnippet(*row) for row in self._slice(query, limit, offset, desc, after)]
 
     def remove(self, orcid: str) -> None:
         try:
@@ -183,6 +490,48 @@ class SQLAlchemyProfiles(Profiles):
 
     def clear(self) -> None:
         self.db.session.query(Profile).delete()
+        self.invalidate_count()
+
+    @staticmethod
+    def _slice(query: Query, limit: Optional[int], offset: int, desc: bool,
+               after: Optional[Tuple[str, str]]) -> Query:
+        # Keyset pagination: seek past the last seen `(index_name, id)` rather than counting
+        # through an offset, so deep pages cost the same as the first one.
+        if after is not None:
+            query = query.filter(Profile.after(after, desc))
+
+        if desc:
+            query = query.order_by(*Profile.desc())
+        else:
+            query = query.order_by(*Profile.asc())
+
+        return query.limit(limit).offset(offset)
+
+    def _query(self, eager: bool = False, single: bool = False) -> Query:
+        """Query profiles, optionally loading their affiliations and email addresses up front.
+
+        A `single` profile has its affiliations joined into the same statement; otherwise
+        they're loaded with one extra `IN` query, as is always done for email addresses, since
+        joining both would multiply every affiliation by every email address.
+        """
+        query = self.db.session.query(Profile)
+
+        if eager:
+            query = query.options(
+                joinedload(Profile.affiliations) if single else selectinload(Profile.affiliations),
+                selectinload(Profile.email_addresses))
+
+        return query
+
+    def invalidate_count(self) -> None:
+        self._count = None
 
     def __len__(self) -> int:
-        return self.db.session.query(Profile).count()
+        if self._count_ttl is None:
+            return self.db.session.query(Profile).count()
+
+        if self._count is None or time.monotonic() - self._counted_at >= self._count_ttl:
+            self._count = self.db.session.query(Profile).count()
+            self._counted_at = time.monotonic()
+
+        return self._count
@@ -0,0 +1,65 @@
+import json
+from typing import Any, Callable, Dict, List
+
+# orjson and ujson are opt-in: neither is in requirements.txt, so unless a deployment installs one
+# responses are encoded with the standard library.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+BACKEND_ORJSON = 'orjson'
+BACKEND_UJSON = 'ujson'
+BACKEND_STDLIB = 'json'
+
+# Fastest first.
+BACKENDS = [BACKEND_ORJSON, BACKEND_UJSON, BACKEND_STDLIB]
+
+Encoder = Callable[[Any], bytes]
+
+
+def _encode_with_orjson(data: Any) -> bytes:
+    return orjson.dumps(data)
+
+
+def _encode_with_ujson(data: Any) -> bytes:
+    return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+def _encode_with_stdlib(data: Any) -> bytes:
+    return json.dumps(data).encode('utf-8')
+
+
+def available_backends() -> List[str]:
+    encoders = _encoders()
+
+    return [backend for backend in BACKENDS if backend in encoders]
+
+
+def get_encoder(backend: str = None) -> Encoder:
+    """Encodes plain data (dicts, lists, strings, numbers...) as JSON, using `backend` or
+    otherwise the fastest one installed. Anything else has to be normalized first."""
+    encoders = _encoders()
+
+    if backend is None:
+        backend = available_backends()[0]
+
+    if backend not in encoders:
+        raise ValueError('JSON backend {} is not available'.format(backend))
+
+    return encoders[backend]
+
+
+def _encoders() -> Dict[str, Encoder]:
+    encoders = {BACKEND_STDLIB: _encode_with_stdlib}
+    if orjson is not None:
+        encoders[BACKEND_ORJSON] = _encode_with_orjson
+    if ujson is not None:
+        encoders[BACKEND_UJSON] = _encode_with_ujson
+
+    return encoders
@@ -1,7 +1,7 @@
 from functools import singledispatch
 from typing import Any
 
-from profiles.models import Affiliation, EmailAddress, Name, Profile
+from profiles.models import Affiliation, EmailAddress, Name, Profile, ProfileSnippet
 
 ACCESS_PUBLIC = 'public'
 ACCESS_RESTRICTED = 'restricted'
@@ -86,6 +86,22 @@ def normalize_profile_snippet(profile: Profile) -> dict:
     return data
 
 
+@normalize_snippet.register(ProfileSnippet)
+def normalize_snippet_row(snippet: ProfileSnippet) -> dict:
+    data = {
+        'id': snippet.id,
+        'name': {
+            'preferred': snippet.preferred_name,
+            'index': snippet.index_name,
+        }
+    }
+
+    if snippet.orcid:
+        data['orcid'] = snippet.orcid
+
+    return data
+
+
 @normalize.register(Name)
 def normalize_name(name: Name) -> dict:
     return {
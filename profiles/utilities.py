@@ -2,10 +2,13 @@ import json
 import os
 import random
 import string
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 from logging import Logger
-from typing import Any, Callable, Union
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
 
 from elife_api_validator import SCHEMA_DIRECTORY
 from flask import request
@@ -46,6 +49,64 @@ def cache(allow_revalidation: bool = True) -> Callable[..., Response]:
     return outer_wrapper
 
 
+class ResponseCache(object):
+    """Thread-safe store of rendered responses for the `size` most recently used resources, each
+    kept for up to `ttl` seconds and possibly in several variants (e.g. public and restricted).
+
+    Resources should be invalidated whenever they change. That only happens in the process that
+    changed them, so other processes have to check that what they get is still current."""
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._entries: Dict[str, Dict[str, Tuple[float, bytes, str]]] = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """Changes on every invalidation; pass the value from before loading a resource to
+        `put`, so that it isn't stored if it changed in the meantime."""
+        return self._generation
+
+    def get(self, key: str, variant: str) -> Optional[Tuple[bytes, str]]:
+        """The rendered `(body, etag)`, if still stored."""
+        with self._lock:
+            variants = self._entries.get(key, {})
+            expires, body, etag = variants.get(variant, (0.0, None, None))
+            if expires <= time.monotonic():
+                variants.pop(variant, None)
+                return None
+
+            self._entries.move_to_end(key)
+
+            return body, etag
+
+    def put(self, key: str, variant: str, body: bytes, etag: str, generation: int) -> None:
+        if not self.size:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._entries.setdefault(key, {})[variant] = (time.monotonic() + self.ttl, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
 def no_cache(func: Callable[..., Response]) -> Callable[..., Response]:
     @wraps(func)
     def wrapper(*args, **kwargs) -> Response:
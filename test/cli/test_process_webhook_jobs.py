@@ -0,0 +1,109 @@
+from typing import Dict
+from unittest.mock import MagicMock, patch
+
+from requests import ConnectionError as RequestsConnectionError
+from sqlalchemy.orm import scoped_session
+
+from profiles.cli import JOB_RETRY_BACKOFF, MAX_JOB_ATTEMPTS, process_webhook_jobs
+from profiles.models import OrcidToken, Profile, WebhookJob
+from profiles.repositories import SQLAlchemyOrcidTokens, SQLAlchemyProfiles, SQLAlchemyWebhookJobs
+from profiles.utilities import expires_at
+
+RECORD = {'person': {'name': {'family-name': {'value': 'Family Name'},
+                              'given-names': {'value': 'Given Names'}}}}
+
+
+def run(webhook_jobs: SQLAlchemyWebhookJobs, profiles: SQLAlchemyProfiles,
+        orcid_tokens: SQLAlchemyOrcidTokens, orcid_config: Dict[str, str],
+        orcid_client: MagicMock) -> None:
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        process_webhook_jobs(webhook_jobs, profiles, orcid_tokens, orcid_config, orcid_client,
+                             until_empty=True)
+
+
+def test_it_updates_queued_profiles(webhook_jobs: SQLAlchemyWebhookJobs,
+                                    profile: Profile, profiles: SQLAlchemyProfiles,
+                                    orcid_tokens: SQLAlchemyOrcidTokens,
+                                    orcid_config: Dict[str, str], mock_orcid_client: MagicMock,
+                                    session: scoped_session):
+    session.add(profile)
+    session.add(OrcidToken(profile.orcid, 'access-token', expires_at(1234)))
+    webhook_jobs.enqueue(profile.orcid)
+    session.commit()
+    mock_orcid_client.get_record.return_value = RECORD
+
+    run(webhook_jobs, profiles, orcid_tokens, orcid_config, mock_orcid_client)
+
+    mock_orcid_client.get_record.assert_called_once_with(profile.orcid, 'access-token')
+    assert profiles.get(profile.id).name.preferred == 'Given Names Family Name'
+    assert session.query(WebhookJob).count() == 0
+
+
+def test_it_updates_a_profile_once_for_several_pings(webhook_jobs: SQLAlchemyWebhookJobs,
+                                                     profile: Profile,
+                                                     profiles: SQLAlchemyProfiles,
+                                                     orcid_tokens: SQLAlchemyOrcidTokens,
+                                                     orcid_config: Dict[str, str],
+                                                     mock_orcid_client: MagicMock,
+                                                     session: scoped_session):
+    session.add(profile)
+    for _ in range(3):
+        webhook_jobs.enqueue(profile.orcid)
+    session.commit()
+    mock_orcid_client.get_record.return_value = RECORD
+
+    run(webhook_jobs, profiles, orcid_tokens, orcid_config, mock_orcid_client)
+
+    assert mock_orcid_client.get_record.call_count == 1
+    assert session.query(WebhookJob).count() == 0
+
+
+def test_it_drops_jobs_for_unknown_profiles(webhook_jobs: SQLAlchemyWebhookJobs,
+                                            profiles: SQLAlchemyProfiles,
+                                            orcid_tokens: SQLAlchemyOrcidTokens,
+                                            orcid_config: Dict[str, str],
+                                            mock_orcid_client: MagicMock,
+                                            session: scoped_session):
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    session.commit()
+
+    run(webhook_jobs, profiles, orcid_tokens, orcid_config, mock_orcid_client)
+
+    assert not mock_orcid_client.get_record.called
+    assert session.query(WebhookJob).count() == 0
+
+
+def failing_job(attempts: int) -> MagicMock:
+    job = WebhookJob('0000-0002-1825-0097')
+    job.attempts = attempts
+
+    webhook_jobs = MagicMock()
+    webhook_jobs.claim.side_effect = [job, None]
+
+    return webhook_jobs
+
+
+def test_it_retries_failed_jobs_later(orcid_config: Dict[str, str],
+                                      mock_orcid_client: MagicMock):
+    webhook_jobs = failing_job(attempts=2)
+    mock_orcid_client.get_record.side_effect = RequestsConnectionError()
+
+    process_webhook_jobs(webhook_jobs, MagicMock(), MagicMock(), orcid_config,
+                         mock_orcid_client, until_empty=True)
+
+    job, delay = webhook_jobs.retry.call_args[0]
+    assert job.orcid == '0000-0002-1825-0097'
+    assert delay == JOB_RETRY_BACKOFF * 2
+    assert not webhook_jobs.complete.called
+
+
+def test_it_gives_up_on_a_job_eventually(orcid_config: Dict[str, str],
+                                         mock_orcid_client: MagicMock):
+    webhook_jobs = failing_job(attempts=MAX_JOB_ATTEMPTS)
+    mock_orcid_client.get_record.side_effect = RequestsConnectionError()
+
+    process_webhook_jobs(webhook_jobs, MagicMock(), MagicMock(), orcid_config,
+                         mock_orcid_client, until_empty=True)
+
+    assert webhook_jobs.complete.called
+    assert not webhook_jobs.retry.called
@@ -0,0 +1,129 @@
+from typing import Dict
+from unittest.mock import MagicMock, patch
+
+import click
+from itsdangerous import URLSafeSerializer
+import pytest
+from requests import HTTPError
+from sqlalchemy.orm import scoped_session
+
+from profiles.cli import PRUNE_BLOCKED, prune_blocked
+from profiles.exceptions import CheckpointNotFound
+from profiles.models import Name, OrcidToken, Profile
+from profiles.repositories import (
+    SQLAlchemyCheckpoints,
+    SQLAlchemyOrcidTokens,
+    SQLAlchemyProfiles
+)
+from profiles.utilities import expires_at
+
+
+def blocked_record(orcid: str, access_token: str) -> dict:
+    if orcid == '0000-0002-1825-0098':
+        raise HTTPError(response=MagicMock(status_code=409))
+
+    return {}
+
+
+@pytest.fixture
+def blocked_profiles(session: scoped_session, mock_orcid_client: MagicMock) -> None:
+    for index in range(5):
+        orcid = '0000-0002-1825-009{}'.format(index + 5)
+        name = 'Person {}'.format(index)
+        session.add(Profile('a{}'.format(index), Name(name, name), orcid))
+        session.add(OrcidToken(orcid, 'access-token-{}'.format(index), expires_at(1234)))
+    session.add(Profile('a5', Name('Unknown', 'Unknown')))
+    session.commit()
+
+    mock_orcid_client.rate_limited.return_value = mock_orcid_client
+    mock_orcid_client.get_record.side_effect = blocked_record
+
+
+def test_it_removes_blocked_profiles_in_batches(blocked_profiles: None,
+                                                profiles: SQLAlchemyProfiles,
+                                                orcid_tokens: SQLAlchemyOrcidTokens,
+                                                checkpoints: SQLAlchemyCheckpoints,
+                                                orcid_config: Dict[str, str],
+                                                mock_orcid_client: MagicMock,
+                                                url_safe_serializer: URLSafeSerializer,
+                                                session: scoped_session):
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        prune_blocked(profiles, orcid_tokens, checkpoints, orcid_config, mock_orcid_client,
+                      url_safe_serializer, workers=2, rate=1000, batch_size=2)
+
+    assert mock_orcid_client.get_record.call_count == 5
+    assert sorted(profile.id for profile in profiles.list()) == ['a0', 'a1', 'a2', 'a4', 'a5']
+    assert len(session.query(OrcidToken).all()) == 4
+    with pytest.raises(CheckpointNotFound):
+        checkpoints.get(PRUNE_BLOCKED)
+
+
+def test_it_resumes_from_its_checkpoint(blocked_profiles: None,
+                                        profiles: SQLAlchemyProfiles,
+                                        orcid_tokens: SQLAlchemyOrcidTokens,
+                                        checkpoints: SQLAlchemyCheckpoints,
+                                        orcid_config: Dict[str, str],
+                                        mock_orcid_client: MagicMock,
+                                        url_safe_serializer: URLSafeSerializer,
+                                        session: scoped_session):
+    checkpoints.save(PRUNE_BLOCKED, ('Person 3', 'a3'))
+    session.commit()
+
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        prune_blocked(profiles, orcid_tokens, checkpoints, orcid_config, mock_orcid_client,
+                      url_safe_serializer, resume=True)
+
+    assert [call[0][0] for call in mock_orcid_client.get_record.call_args_list] == \
+        ['0000-0002-1825-0099']
+    assert len(profiles) == 6
+
+
+def test_it_starts_after_a_given_profile(blocked_profiles: None,
+                                         profiles: SQLAlchemyProfiles,
+                                         orcid_tokens: SQLAlchemyOrcidTokens,
+                                         checkpoints: SQLAlchemyCheckpoints,
+                                         orcid_config: Dict[str, str],
+                                         mock_orcid_client: MagicMock,
+                                         url_safe_serializer: URLSafeSerializer):
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        prune_blocked(profiles, orcid_tokens, checkpoints, orcid_config, mock_orcid_client,
+                      url_safe_serializer, since='a1')
+
+    assert [call[0][0] for call in mock_orcid_client.get_record.call_args_list] == \
+        ['0000-0002-1825-0097', '0000-0002-1825-0098', '0000-0002-1825-0099']
+
+
+def test_it_rejects_an_unknown_starting_profile(blocked_profiles: None,
+                                                profiles: SQLAlchemyProfiles,
+                                                orcid_tokens: SQLAlchemyOrcidTokens,
+                                                checkpoints: SQLAlchemyCheckpoints,
+                                                orcid_config: Dict[str, str],
+                                                mock_orcid_client: MagicMock,
+                                                url_safe_serializer: URLSafeSerializer):
+    with pytest.raises(click.BadParameter):
+        prune_blocked(profiles, orcid_tokens, checkpoints, orcid_config, mock_orcid_client,
+                      url_safe_serializer, since='unknown')
+
+    mock_orcid_client.get_record.assert_not_called()
+
+
+def test_it_keeps_its_checkpoint_if_interrupted(blocked_profiles: None,
+                                                profiles: SQLAlchemyProfiles,
+                                                orcid_tokens: SQLAlchemyOrcidTokens,
+                                                checkpoints: SQLAlchemyCheckpoints,
+                                                orcid_config: Dict[str, str],
+                                                mock_orcid_client: MagicMock,
+                                                url_safe_serializer: URLSafeSerializer):
+    def interrupted(orcid: str, access_token: str) -> dict:
+        if orcid == '0000-0002-1825-0099':
+            raise KeyboardInterrupt
+
+        return blocked_record(orcid, access_token)
+
+    mock_orcid_client.get_record.side_effect = interrupted
+
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        prune_blocked(profiles, orcid_tokens, checkpoints, orcid_config, mock_orcid_client,
+                      url_safe_serializer, workers=1, batch_size=2)
+
+    assert checkpoints.get(PRUNE_BLOCKED).position == ('Person 3', 'a3')
@@ -0,0 +1,68 @@
+from typing import Dict
+from unittest.mock import MagicMock, patch
+
+from itsdangerous import URLSafeSerializer
+import pytest
+from sqlalchemy.orm import scoped_session
+
+from profiles.cli import SET_ORCID_WEBHOOKS, SetOrcidWebhooksCommand
+from profiles.exceptions import CheckpointNotFound
+from profiles.models import Name, Profile
+from profiles.repositories import SQLAlchemyCheckpoints, SQLAlchemyProfiles
+
+
+@pytest.fixture
+def some_profiles(session: scoped_session) -> None:
+    for index in range(5):
+        name = 'Person {}'.format(index)
+        session.add(Profile('a{}'.format(index), Name(name, name),
+                            '0000-0002-1825-009{}'.format(index + 5)))
+    session.commit()
+
+
+def test_it_sets_webhooks_for_every_profile(some_profiles: None,
+                                            profiles: SQLAlchemyProfiles,
+                                            checkpoints: SQLAlchemyCheckpoints,
+                                            orcid_config: Dict[str, str],
+                                            mock_orcid_client: MagicMock,
+                                            url_safe_serializer: URLSafeSerializer):
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        SetOrcidWebhooksCommand(profiles, checkpoints, orcid_config, mock_orcid_client,
+                                url_safe_serializer, batch_size=2)
+
+    assert mock_orcid_client.set_webhook.call_count == 5
+    with pytest.raises(CheckpointNotFound):
+        checkpoints.get(SET_ORCID_WEBHOOKS)
+
+
+def test_it_resumes_from_its_checkpoint(some_profiles: None,
+                                        profiles: SQLAlchemyProfiles,
+                                        checkpoints: SQLAlchemyCheckpoints,
+                                        orcid_config: Dict[str, str],
+                                        mock_orcid_client: MagicMock,
+                                        url_safe_serializer: URLSafeSerializer,
+                                        session: scoped_session):
+    checkpoints.save(SET_ORCID_WEBHOOKS, ('Person 2', 'a2'))
+    session.commit()
+
+    with patch('profiles.orcid.OrcidClient._get_session'):
+        SetOrcidWebhooksCommand(profiles, checkpoints, orcid_config, mock_orcid_client,
+                                url_safe_serializer, resume=True)
+
+    assert [call[0][0] for call in mock_orcid_client.set_webhook.call_args_list] == \
+        ['0000-0002-1825-0098', '0000-0002-1825-0099']
+
+
+def test_it_saves_a_checkpoint_after_each_batch(some_profiles: None,
+                                                profiles: SQLAlchemyProfiles,
+                                                checkpoints: SQLAlchemyCheckpoints,
+                                                orcid_config: Dict[str, str],
+                                                mock_orcid_client: MagicMock,
+                                                url_safe_serializer: URLSafeSerializer):
+    mock_orcid_client.set_webhook.side_effect = [None, None, None, KeyboardInterrupt]
+
+    with patch('profiles.orcid.OrcidClient._get_session'), pytest.raises(KeyboardInterrupt):
+        SetOrcidWebhooksCommand(profiles, checkpoints, orcid_config, mock_orcid_client,
+                                url_safe_serializer, batch_size=2)
+
+    assert checkpoints.get(SET_ORCID_WEBHOOKS).position == ('Person 1', 'a1')
@@ -1,12 +1,19 @@
+from typing import Callable, ContextManager, List
 from unittest import mock
+
 from hypothesis import given
 from hypothesis.searchstrategy import SearchStrategy
 from hypothesis.strategies import sampled_from
 from iso3166 import countries
 import pytest
 
-from profiles.commands import extract_email_addresses, update_profile_from_orcid_record
-from profiles.models import Address, Affiliation, Date, Name, Profile
+from profiles.commands import (
+    ORCID_RECORD_MAPPER,
+    extract_email_addresses,
+    orcid_record_fingerprint,
+    update_profile_from_orcid_record
+)
+from profiles.models import Address, Affiliation, Date, Name, Profile, db
 
 
 def given_names() -> SearchStrategy:
@@ -55,6 +62,37 @@ def test_it_can_extract_email_addresses_ignoring_unverified():
     assert extract_email_addresses(orcid_record, only_verified=True) == expected_without
 
 
+def test_extracted_email_addresses_are_not_the_records_own():
+    orcid_record = {'person': {
+        'emails': {'email': [
+            {'email': '1@example.com', 'primary': True, 'verified': False, 'visibility': 'LIMIT'},
+        ]},
+    }}
+
+    extract_email_addresses(orcid_record, only_verified=False).clear()
+
+    assert len(orcid_record['person']['emails']['email']) == 1
+
+
+def test_the_mapper_copes_with_missing_sections():
+    assert ORCID_RECORD_MAPPER.name({'person': {'name': None}}) == (None, None)
+    assert ORCID_RECORD_MAPPER.email_addresses({}) == []
+    assert ORCID_RECORD_MAPPER.employments({'activities-summary': None}) == []
+
+
+def test_the_mapper_leaves_out_nulls():
+    orcid_record = {
+        'person': {'emails': {'email': [None, {'email': '1@example.com', 'verified': True}]}},
+        'activities-summary': {'employments': {'employment-summary': [None, {'put-code': 1}]}},
+    }
+
+    assert ORCID_RECORD_MAPPER.email_addresses(orcid_record) == \
+        [{'email': '1@example.com', 'verified': True}]
+    assert ORCID_RECORD_MAPPER.employments(orcid_record) == [{'put-code': 1}]
+    assert ORCID_RECORD_MAPPER.employments(
+        {'activities-summary': {'employments': {'employment-summary': {'put-code': 1}}}}) == []
+
+
 @given(given_names(), family_name())
 def test_it_updates_the_name(given_names: str, family_name: str):
     profile = Profile('12345678', Name('Old Name'))
@@ -361,3 +399,146 @@ def test_it_updates_email_addresses():
     assert profile.email_addresses[0].email == '1@example.com'
     assert profile.email_addresses[0].restricted is False
     assert profile.email_addresses[0].position == 0
+
+
+def test_it_skips_email_addresses_belonging_to_other_profiles(
+        count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    other_profile = Profile('12345679', Name('Other'))
+    other_profile.add_email_address('1@example.com')
+    other_profile.add_email_address('2@example.com')
+    db.session.add(other_profile)
+    db.session.flush()
+
+    profile = Profile('12345678', Name('Name'))
+    orcid_record = {'person': {
+        'emails': {'email': [
+            {'email': '{}@example.com'.format(index), 'primary': index == 1, 'verified': True,
+             'visibility': 'PUBLIC'}
+            for index in range(1, 6)
+        ]},
+    }}
+
+    with count_queries() as queries:
+        update_profile_from_orcid_record(profile, orcid_record)
+
+    assert len(queries) == 1
+    assert [email.email for email in profile.email_addresses] == \
+        ['3@example.com', '4@example.com', '5@example.com']
+
+
+def test_it_skips_email_addresses_belonging_to_other_profiles_in_another_case():
+    other_profile = Profile('12345679', Name('Other'))
+    other_profile.add_email_address('Foo@Example.com')
+    db.session.add(other_profile)
+    db.session.flush()
+
+    profile = Profile('12345678', Name('Name'))
+    orcid_record = {'person': {
+        'emails': {'email': [
+            {'email': 'foo@example.com', 'primary': True, 'verified': True,
+             'visibility': 'PUBLIC'},
+        ]},
+    }}
+
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    assert len(profile.email_addresses) == 0
+
+
+def test_it_does_not_update_a_profile_if_the_record_is_unchanged():
+    profile = Profile('12345678', Name('Name'))
+    orcid_record = {'path': '0000-0002-1825-0097', 'person': {
+        'name': {'family-name': {'value': 'Family Name'}, 'given-names': {'value': 'Given Names'}}
+    }}
+
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    assert profile.orcid_record_fingerprint == orcid_record_fingerprint(orcid_record)
+
+    with mock.patch('profiles.commands._update_name_from_orcid_record') as update_name:
+        update_profile_from_orcid_record(profile, orcid_record)
+
+    assert not update_name.called
+
+
+def test_it_updates_a_profile_if_the_record_has_changed():
+    profile = Profile('12345678', Name('Name'))
+    orcid_record = {'person': {'name': {'given-names': {'value': 'Given Names'}}}}
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    orcid_record['person']['name']['given-names']['value'] = 'Other Names'
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    assert profile.name.preferred == 'Other Names'
+
+
+def test_it_keeps_its_own_email_address_when_another_profile_has_it_in_another_case():
+    other_profile = Profile('12345679', Name('Other'))
+    other_profile.add_email_address('foo@example.com')
+    profile = Profile('12345678', Name('Name'))
+    profile.add_email_address('Foo@example.com')
+    db.session.add(other_profile)
+    db.session.add(profile)
+    db.session.flush()
+
+    orcid_record = {'person': {
+        'emails': {'email': [
+            {'email': 'Foo@example.com', 'primary': True, 'verified': True,
+             'visibility': 'PUBLIC'},
+        ]},
+    }}
+
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    assert [email.email for email in profile.email_addresses] == ['Foo@example.com']
+
+
+def test_it_tries_again_to_add_email_addresses_belonging_to_other_profiles():
+    other_profile = Profile('12345679', Name('Other'))
+    other_profile.add_email_address('1@example.com')
+    db.session.add(other_profile)
+    db.session.flush()
+
+    profile = Profile('12345678', Name('Name'))
+    orcid_record = {'person': {
+        'emails': {'email': [
+            {'email': '1@example.com', 'primary': True, 'verified': True, 'visibility': 'PUBLIC'},
+        ]},
+    }}
+
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    assert profile.orcid_record_fingerprint is None
+    assert len(profile.email_addresses) == 0
+
+    other_profile.remove_email_address('1@example.com')
+    db.session.flush()
+
+    update_profile_from_orcid_record(profile, orcid_record)
+
+    assert profile.orcid_record_fingerprint == orcid_record_fingerprint(orcid_record)
+    assert [email.email for email in profile.email_addresses] == ['1@example.com']
+
+
+def test_the_fingerprint_ignores_parts_of_the_record_that_are_not_used():
+    orcid_record = {
+        'person': {'emails': {'email': [{'email': '1@example.com', 'primary': True,
+                                         'verified': True, 'visibility': 'PUBLIC',
+                                         'last-modified-date': {'value': 1}}]}},
+        'activities-summary': {'employments': {'employment-summary': [
+            {'put-code': 1, 'organization': {'name': 'Organisation'}, 'visibility': 'PUBLIC',
+             'last-modified-date': {'value': 1}}
+        ]}},
+    }
+    fingerprint = orcid_record_fingerprint(orcid_record)
+
+    orcid_record['person']['emails']['email'][0]['last-modified-date']['value'] = 2
+    orcid_record['person']['emails']['email'].append({'email': '2@example.com', 'primary': False,
+                                                      'verified': False, 'visibility': 'PUBLIC'})
+    orcid_record['activities-summary']['employments']['employment-summary'][0][
+        'last-modified-date']['value'] = 2
+
+    assert orcid_record_fingerprint(orcid_record) == fingerprint
+
+    with mock.patch('profiles.commands.ORCID_RECORD_FINGERPRINT_VERSION', 2):
+        assert orcid_record_fingerprint(orcid_record) != fingerprint
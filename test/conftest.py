@@ -1,7 +1,8 @@
 import hashlib
 import logging
 import os
-from typing import Callable, Dict
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Dict, List
 from unittest.mock import MagicMock, patch
 
 from _pytest.fixtures import FixtureRequest
@@ -23,7 +24,12 @@ from profiles.factory import create_app
 from profiles.models import Date, Name, OrcidToken, Profile
 from profiles.database import db
 from profiles.orcid import OrcidClient
-from profiles.repositories import SQLAlchemyOrcidTokens, SQLAlchemyProfiles
+from profiles.repositories import (
+    SQLAlchemyCheckpoints,
+    SQLAlchemyOrcidTokens,
+    SQLAlchemyProfiles,
+    SQLAlchemyWebhookJobs
+)
 from profiles.utilities import expires_at
 
 BUILD_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/build/'
@@ -111,7 +117,7 @@ def database(app: Flask, request: FixtureRequest) -> SQLAlchemy:
 
 
 @fixture(scope='function', autouse=True)
-def session(database: SQLAlchemy, request: FixtureRequest) -> scoped_session:
+def session(app: Flask, database: SQLAlchemy, request: FixtureRequest) -> scoped_session:
     connection = database.engine.connect()
     transaction = connection.begin()
 
@@ -124,11 +130,33 @@ def session(database: SQLAlchemy, request: FixtureRequest) -> scoped_session:
         transaction.rollback()
         connection.close()
         session.remove()
+        # Rolling back doesn't emit `models_committed`, so reset anything cached on commit.
+        app.profiles.invalidate_count()
+        app.profile_responses.clear()
 
     request.addfinalizer(teardown)
     return session
 
 
+@fixture
+def count_queries(database: SQLAlchemy) -> Callable[[], ContextManager[List[str]]]:
+    @contextmanager
+    def counter():
+        statements = []
+
+        # pylint:disable=unused-argument
+        def before_cursor_execute(connection: Connection, cursor, statement: str, *args) -> None:
+            statements.append(statement)
+
+        event.listen(database.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(database.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
+
+
 @fixture
 def test_client(app: Flask) -> FlaskClient:
     return app.test_client()
@@ -178,6 +206,11 @@ def orcid_token() -> OrcidToken:
     return OrcidToken('0000-0002-1825-0097', '1/fFAGRNJru1FTz70BzhT3Zg', expires_at(1234))
 
 
+@fixture
+def checkpoints() -> SQLAlchemyCheckpoints:
+    return SQLAlchemyCheckpoints(db)
+
+
 @fixture
 def orcid_tokens() -> SQLAlchemyOrcidTokens:
     return SQLAlchemyOrcidTokens(db)
@@ -188,6 +221,11 @@ def profiles() -> SQLAlchemyProfiles:
     return SQLAlchemyProfiles(db)
 
 
+@fixture
+def webhook_jobs() -> SQLAlchemyWebhookJobs:
+    return SQLAlchemyWebhookJobs(db)
+
+
 @fixture
 def registered_handler_names():
     handler_names = []
@@ -233,7 +271,7 @@ def public_token_resp_data():
 @fixture
 def commit(session: Session) -> Callable[[], None]:
     def wrapped() -> None:
-        with patch('profiles.orcid.requests'):
+        with patch('profiles.orcid.OrcidClient._get_session'):
             session.commit()
 
     return wrapped
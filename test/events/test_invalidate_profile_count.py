@@ -0,0 +1,41 @@
+from typing import List
+from unittest.mock import MagicMock
+
+from profiles.events import invalidate_profile_count
+from profiles.models import OrcidToken, Profile
+
+
+def test_it_has_a_valid_signal_handler_registered_on_app(registered_handler_names: List[str]):
+    assert 'count_invalidator' in registered_handler_names
+
+
+def test_it_invalidates_the_count_when_a_profile_is_inserted(profile: Profile) -> None:
+    profiles = MagicMock()
+    count_invalidator = invalidate_profile_count(profiles)
+    count_invalidator({}, [(profile, 'insert')])
+
+    assert profiles.invalidate_count.called
+
+
+def test_it_invalidates_the_count_when_a_profile_is_deleted(profile: Profile) -> None:
+    profiles = MagicMock()
+    count_invalidator = invalidate_profile_count(profiles)
+    count_invalidator({}, [(profile, 'delete')])
+
+    assert profiles.invalidate_count.called
+
+
+def test_it_does_not_invalidate_the_count_when_a_profile_is_updated(profile: Profile) -> None:
+    profiles = MagicMock()
+    count_invalidator = invalidate_profile_count(profiles)
+    count_invalidator({}, [(profile, 'update')])
+
+    assert not profiles.invalidate_count.called
+
+
+def test_it_ignores_other_models_being_committed(orcid_token: OrcidToken) -> None:
+    profiles = MagicMock()
+    count_invalidator = invalidate_profile_count(profiles)
+    count_invalidator({}, [(orcid_token, 'insert')])
+
+    assert not profiles.invalidate_count.called
@@ -0,0 +1,29 @@
+from typing import List
+from unittest.mock import MagicMock
+
+from iso3166 import countries
+
+from profiles.events import invalidate_profile_responses
+from profiles.models import Address, Affiliation, OrcidToken, Profile
+
+
+def test_it_has_a_valid_signal_handler_registered_on_app(registered_handler_names: List[str]):
+    assert 'response_invalidator' in registered_handler_names
+
+
+def test_it_invalidates_responses_for_changed_profiles(profile: Profile) -> None:
+    affiliation = Affiliation('1', Address(countries.get('gb'), 'City'), 'Organisation')
+    affiliation.profile_id = '12345679'
+    response_cache = MagicMock()
+    response_invalidator = invalidate_profile_responses(response_cache)
+    response_invalidator({}, [(profile, 'update'), (affiliation, 'delete')])
+
+    response_cache.invalidate.assert_called_once_with({profile.id, '12345679'})
+
+
+def test_it_ignores_other_models_being_committed(orcid_token: OrcidToken) -> None:
+    response_cache = MagicMock()
+    response_invalidator = invalidate_profile_responses(response_cache)
+    response_invalidator({}, [(orcid_token, 'insert')])
+
+    assert not response_cache.invalidate.called
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from iso3166 import countries
 
 from profiles.models import Address, Affiliation, Date
@@ -102,3 +104,24 @@ def test_it_can_detect_if_not_current_with_no_starts_date_and_past_ends_date(yes
     affiliation = Affiliation('1', address=address, organisation='Org', ends=yesterday)
 
     assert affiliation.is_current() is False
+
+
+def test_it_knows_the_widest_bounds_of_its_dates():
+    affiliation = Affiliation('1', Address(countries.get('gb'), 'City'), 'Organisation',
+                              starts=Date(2016, 2), ends=Date(2017))
+
+    assert affiliation.starts_at == datetime(2016, 2, 1, tzinfo=timezone.utc)
+    assert affiliation.ends_at == datetime(2017, 12, 31, tzinfo=timezone.utc)
+
+    affiliation.set_ends(None)
+
+    assert affiliation.ends_at is None
+
+
+def test_it_can_detect_if_current_at_a_given_time():
+    affiliation = Affiliation('1', Address(countries.get('gb'), 'City'), 'Organisation',
+                              starts=Date(2016, 2), ends=Date(2017))
+
+    assert affiliation.is_current(datetime(2016, 1, 31, tzinfo=timezone.utc)) is False
+    assert affiliation.is_current(datetime(2016, 2, 2, tzinfo=timezone.utc)) is True
+    assert affiliation.is_current(datetime(2018, 1, 1, tzinfo=timezone.utc)) is False
@@ -4,7 +4,7 @@ from iso3166 import countries
 import pytest
 
 from profiles.exceptions import AffiliationNotFound
-from profiles.models import Address, Affiliation, Date, Name, Profile
+from profiles.models import Address, Affiliation, Date, EmailAddress, Name, Profile
 
 
 @given(text(), text(), text())
@@ -169,3 +169,50 @@ def test_it_can_get_all_affiliations_including_restricted(yesterday):
     affiliations = profile.get_affiliations(include_restricted=True)
 
     assert len(affiliations) == 3
+
+
+def test_it_can_sync_affiliations():
+    address = Address(countries.get('gb'), 'City')
+    profile = Profile('12345678', Name('foo'), '0000-0002-1825-0097')
+    profile.add_affiliation(Affiliation('1', address=address, organisation='Old'))
+    profile.add_affiliation(Affiliation('2', address=address, organisation='Org'))
+    existing = profile.get_affiliation('1')
+
+    profile.sync_affiliations([
+        Affiliation('3', address=address, organisation='Org'),
+        Affiliation('1', address=address, organisation='New', restricted=True),
+    ])
+
+    assert [affiliation.id for affiliation in profile.affiliations] == ['3', '1']
+    assert [affiliation.position for affiliation in profile.affiliations] == [0, 1]
+    assert profile.get_affiliation('1') is existing
+    assert existing.organisation == 'New'
+    assert existing.restricted is True
+
+
+def test_it_can_sync_email_addresses():
+    profile = Profile('12345678', Name('foo'), '0000-0002-1825-0097')
+    profile.add_email_address('1@example.com')
+    profile.add_email_address('2@example.com')
+    profile.add_email_address('3@example.com')
+    existing = profile.email_addresses[2]
+
+    profile.sync_email_addresses([
+        EmailAddress('4@example.com'),
+        EmailAddress('5@example.com', restricted=True),
+        EmailAddress('3@example.com', restricted=True),
+        EmailAddress('1@example.com'),
+    ], primary='5@example.com')
+
+    assert [email.email for email in profile.email_addresses] == \
+        ['5@example.com', '1@example.com', '3@example.com', '4@example.com']
+    assert [email.position for email in profile.email_addresses] == [0, 1, 2, 3]
+    assert profile.email_addresses[2] is existing
+    assert existing.restricted is True
+
+
+def test_it_filters_for_profiles_after_a_position_as_a_row_value():
+    assert str(Profile.after(('2, Name', '11111112'))) == \
+        '(profile.index_name, profile.id) > (:param_1, :param_2)'
+    assert str(Profile.after(('2, Name', '11111112'), desc=True)) == \
+        '(profile.index_name, profile.id) < (:param_1, :param_2)'
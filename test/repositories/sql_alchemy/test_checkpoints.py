@@ -0,0 +1,48 @@
+import pytest
+
+from profiles.database import db
+from profiles.exceptions import CheckpointNotFound
+from profiles.repositories import SQLAlchemyCheckpoints
+
+
+def test_it_saves_checkpoints():
+    checkpoints = SQLAlchemyCheckpoints(db)
+
+    checkpoints.save('command', ('Doe, Jane', 'a1b2c3d4'))
+
+    assert checkpoints.get('command').position == ('Doe, Jane', 'a1b2c3d4')
+
+    with pytest.raises(CheckpointNotFound):
+        checkpoints.get('other-command')
+
+
+def test_it_moves_a_checkpoint_on():
+    checkpoints = SQLAlchemyCheckpoints(db)
+
+    checkpoints.save('command', ('Doe, Jane', 'a1b2c3d4'))
+    checkpoints.save('command', ('Doe, John', 'e5f6g7h8'))
+
+    assert checkpoints.get('command').position == ('Doe, John', 'e5f6g7h8')
+
+
+def test_it_removes_a_checkpoint():
+    checkpoints = SQLAlchemyCheckpoints(db)
+    checkpoints.save('command', ('Doe, Jane', 'a1b2c3d4'))
+    checkpoints.save('other-command', ('Doe, Jane', 'a1b2c3d4'))
+
+    checkpoints.remove('command')
+    checkpoints.remove('unknown-command')
+
+    with pytest.raises(CheckpointNotFound):
+        checkpoints.get('command')
+    assert checkpoints.get('other-command')
+
+
+def test_it_clears_checkpoints():
+    checkpoints = SQLAlchemyCheckpoints(db)
+    checkpoints.save('command', ('Doe, Jane', 'a1b2c3d4'))
+
+    checkpoints.clear()
+
+    with pytest.raises(CheckpointNotFound):
+        checkpoints.get('command')
@@ -1,11 +1,27 @@
+from typing import Callable, ContextManager, List
+
+from iso3166 import countries
 import pytest
 
 from profiles.database import db
 from profiles.exceptions import ProfileNotFound
-from profiles.models import Name, Profile
+from profiles.models import Address, Affiliation, Date, Name, Profile
 from profiles.repositories import SQLAlchemyProfiles
 
 
+def add_profile_with_children(profiles: SQLAlchemyProfiles, profile_id: str,
+                              orcid: str = None) -> Profile:
+    profile = Profile(profile_id, Name('Name {}'.format(profile_id)), orcid)
+    for number in range(1, 4):
+        profile.add_affiliation(Affiliation('{}-{}'.format(profile_id, number),
+                                            Address(countries.get('gb'), 'City'),
+                                            'Organisation', Date(2017)), number - 1)
+    profile.add_email_address('{}@example.com'.format(profile_id))
+    profile.add_email_address('{}@example.org'.format(profile_id))
+
+    return profiles.add(profile)
+
+
 def test_it_contains_profiles():
     profiles = SQLAlchemyProfiles(db)
 
@@ -69,6 +85,23 @@ def test_it_gets_profiles_by_their_orcid():
         profiles.get_by_orcid('0000-0002-1825-0098')
 
 
+def test_it_gets_many_profiles(count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    profiles = SQLAlchemyProfiles(db)
+    for profile_id in ['12345678', '12345679', '12345680']:
+        add_profile_with_children(profiles, profile_id)
+    db.session.expunge_all()
+
+    with count_queries() as queries:
+        found = profiles.get_many(['12345680', '12345678', '12345681'], eager=True)
+        for profile in found:
+            assert len(profile.affiliations) == 3
+            assert len(profile.email_addresses) == 2
+
+    assert sorted(profile.id for profile in found) == ['12345678', '12345680']
+    assert len(queries) == 3
+    assert profiles.get_many([]) == []
+
+
 def test_it_gets_profiles_by_their_email_address():
     profiles = SQLAlchemyProfiles(db)
 
@@ -95,6 +128,197 @@ def test_it_gets_profiles_by_their_email_address():
         profiles.get_by_email_address('qux@example.com', 'quxx@example.com')
 
 
+def test_it_gets_profiles_by_their_email_address_ignoring_case():
+    profiles = SQLAlchemyProfiles(db)
+
+    profile = Profile('12345678', Name('name'))
+    profile.add_email_address('Foo@Example.com')
+    profiles.add(profile)
+
+    assert profiles.get_by_email_address('foo@example.com') == profile
+    assert profiles.get_by_email_address('FOO@EXAMPLE.COM') == profile
+
+
+def test_it_prefers_an_exact_email_address_match_when_several_profiles_differ_only_in_case():
+    profiles = SQLAlchemyProfiles(db)
+
+    profile1 = Profile('12345678', Name('name1'))
+    profile1.add_email_address('Foo@example.com')
+    profile2 = Profile('12345679', Name('name2'))
+    profile2.add_email_address('foo@example.com')
+    profiles.add(profile1)
+    profiles.add(profile2)
+
+    assert profiles.get_by_email_address('foo@example.com') == profile2
+    assert profiles.get_by_email_address('Foo@example.com') == profile1
+
+
+def test_it_gets_profile_ids_by_email_address():
+    profiles = SQLAlchemyProfiles(db)
+
+    profile1 = Profile('12345678', Name('name1'))
+    profile1.add_email_address('foo@example.com')
+    profile1.add_email_address('bar@example.com')
+    profile2 = Profile('12345679', Name('name2'))
+    profile2.add_email_address('baz@example.com')
+
+    profiles.add(profile1)
+    profiles.add(profile2)
+
+    profile_ids = profiles.get_profile_ids_by_email_address('foo@example.com', 'baz@example.com',
+                                                            'qux@example.com')
+
+    assert profile_ids == {'foo@example.com': '12345678', 'baz@example.com': '12345679'}
+    assert profiles.get_profile_ids_by_email_address() == {}
+
+
+def test_it_gets_profile_ids_by_email_address_ignoring_case():
+    profiles = SQLAlchemyProfiles(db)
+
+    profile = Profile('12345678', Name('name'))
+    profile.add_email_address('Foo@Example.com')
+    profiles.add(profile)
+
+    assert profiles.get_profile_ids_by_email_address('foo@example.com', 'FOO@example.com') == \
+        {'foo@example.com': '12345678', 'FOO@example.com': '12345678'}
+
+
+def test_it_prefers_exact_email_address_matches_for_profile_ids():
+    profiles = SQLAlchemyProfiles(db)
+
+    profile1 = Profile('12345678', Name('name1'))
+    profile1.add_email_address('Foo@example.com')
+    profile2 = Profile('12345679', Name('name2'))
+    profile2.add_email_address('foo@example.com')
+    profiles.add(profile1)
+    profiles.add(profile2)
+
+    profile_ids = profiles.get_profile_ids_by_email_address('Foo@example.com', 'foo@example.com',
+                                                            'FOO@example.com')
+
+    assert profile_ids == {'Foo@example.com': '12345678', 'foo@example.com': '12345679',
+                           'FOO@example.com': '12345678'}
+
+
+def test_it_can_leave_restricted_email_addresses_out_of_profile_ids():
+    profiles = SQLAlchemyProfiles(db)
+
+    profile = Profile('12345678', Name('name'))
+    profile.add_email_address('foo@example.com', restricted=True)
+    profile.add_email_address('bar@example.com')
+    profiles.add(profile)
+
+    assert profiles.get_profile_ids_by_email_address(
+        'foo@example.com', 'bar@example.com', include_restricted=False) == \
+        {'bar@example.com': '12345678'}
+
+
+def test_it_gets_profile_ids_by_orcid():
+    profiles = SQLAlchemyProfiles(db)
+
+    profiles.add(Profile('12345678', Name('name1'), '0000-0002-1825-0097'))
+    profiles.add(Profile('12345679', Name('name2')))
+
+    assert profiles.get_profile_ids_by_orcid('0000-0002-1825-0097', '0000-0002-1825-0098') == \
+        {'0000-0002-1825-0097': '12345678'}
+    assert profiles.get_profile_ids_by_orcid() == {}
+
+
+def test_it_gets_current_affiliations():
+    profiles = SQLAlchemyProfiles(db)
+    address = Address(countries.get('gb'), 'City')
+
+    profile = Profile('12345678', Name('name'))
+    profile.sync_affiliations([
+        Affiliation('1', address, 'Org', starts=Date.yesterday()),
+        Affiliation('2', address, 'Org', starts=Date.tomorrow()),
+        Affiliation('3', address, 'Org', ends=Date.yesterday()),
+        Affiliation('4', address, 'Org', ends=Date.tomorrow(), restricted=True),
+        Affiliation('5', address, 'Org'),
+    ])
+    other_profile = Profile('12345679', Name('other'))
+    other_profile.add_affiliation(Affiliation('6', address, 'Org'))
+
+    profiles.add(profile)
+    profiles.add(other_profile)
+
+    assert [affiliation.id for affiliation in profiles.get_current_affiliations('12345678')] == \
+        ['1', '5']
+    assert [affiliation.id for affiliation in
+            profiles.get_current_affiliations('12345678', include_restricted=True)] == \
+        ['1', '4', '5']
+
+
+def test_it_knows_when_profiles_were_updated():
+    profiles = SQLAlchemyProfiles(db)
+
+    assert profiles.last_updated_at() is None
+    assert profiles.count_and_last_updated_at() == (0, None)
+
+    profile = profiles.add(Profile('12345678', Name('name')))
+    db.session.flush()
+    updated_at = profiles.get_updated_at('12345678')
+
+    assert updated_at is not None
+    assert profiles.last_updated_at() == updated_at
+    assert profiles.count_and_last_updated_at() == (1, updated_at)
+
+    profile.add_affiliation(Affiliation('1', Address(countries.get('gb'), 'City'), 'Org'))
+    db.session.flush()
+
+    assert profiles.get_updated_at('12345678') > updated_at
+
+    with pytest.raises(ProfileNotFound):
+        profiles.get_updated_at('12345679')
+
+    assert profiles.get_many_updated_at(['12345678', '12345679']) == \
+        {'12345678': profiles.get_updated_at('12345678')}
+    assert profiles.get_many_updated_at([]) == {}
+
+
+def test_it_eagerly_loads_a_profile_in_a_bounded_number_of_queries(
+        count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    profiles = SQLAlchemyProfiles(db)
+    add_profile_with_children(profiles, '11111111', '0000-0002-1825-0097')
+    db.session.expire_all()
+
+    with count_queries() as statements:
+        profile = profiles.get('11111111', eager=True)
+
+        assert len(profile.affiliations) == 3
+        assert len(profile.email_addresses) == 2
+
+    assert len(statements) == 2
+
+    db.session.expire_all()
+
+    with count_queries() as statements:
+        profile = profiles.get_by_orcid('0000-0002-1825-0097', eager=True)
+
+        assert len(profile.affiliations) == 3
+        assert len(profile.email_addresses) == 2
+
+    assert len(statements) == 2
+
+
+def test_it_eagerly_loads_a_list_of_profiles_in_a_bounded_number_of_queries(
+        count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    profiles = SQLAlchemyProfiles(db)
+    for number in range(1, 6):
+        add_profile_with_children(profiles, '1111111{}'.format(number))
+    db.session.expire_all()
+
+    with count_queries() as statements:
+        profiles_list = profiles.list(eager=True)
+
+        for profile in profiles_list:
+            assert len(profile.affiliations) == 3
+            assert len(profile.email_addresses) == 2
+
+    assert len(profiles_list) == 5
+    assert len(statements) == 3
+
+
 def test_it_generates_the_next_profile_id():
     def id_generator():
         return '11111111'
@@ -179,6 +403,119 @@ def test_it_lists_profiles_in_slices():
     assert len(profiles_list) == 0
 
 
+def test_it_lists_profiles_with_the_same_name_in_id_order():
+    profiles = SQLAlchemyProfiles(db)
+    profiles.add(Profile('11111112', Name('Name')))
+    profiles.add(Profile('11111113', Name('Name')))
+    profiles.add(Profile('11111111', Name('Name')))
+
+    profiles_list = profiles.list(desc=False)
+
+    assert [profile.id for profile in profiles_list] == ['11111111', '11111112', '11111113']
+
+    profiles_list = profiles.list()
+
+    assert [profile.id for profile in profiles_list] == ['11111113', '11111112', '11111111']
+
+
+def test_it_lists_profiles_after_a_position():
+    profiles = SQLAlchemyProfiles(db)
+    profiles.add(Profile('11111111', Name('Name 1')))
+    profiles.add(Profile('11111112', Name('Name 2')))
+    profiles.add(Profile('11111113', Name('Name 2')))
+    profiles.add(Profile('11111114', Name('Name 3')))
+
+    profiles_list = profiles.list(after=('2, Name', '11111112'), desc=False)
+
+    assert [profile.id for profile in profiles_list] == ['11111113', '11111114']
+
+    profiles_list = profiles.list(after=('2, Name', '11111113'))
+
+    assert [profile.id for profile in profiles_list] == ['11111112', '11111111']
+
+    profiles_list = profiles.list(limit=1, after=('3, Name', '11111114'))
+
+    assert [profile.id for profile in profiles_list] == ['11111113']
+
+
+def test_it_lists_profile_snippets():
+    profiles = SQLAlchemyProfiles(db)
+    profiles.add(Profile('11111111', Name('Name 1'), '0000-0002-1825-0097'))
+    profiles.add(Profile('11111112', Name('Name 2')))
+    profiles.add(Profile('11111113', Name('Name 3')))
+
+    snippets = profiles.list_snippets(limit=2)
+
+    assert [snippet.id for snippet in snippets] == ['11111113', '11111112']
+    assert [snippet.preferred_name for snippet in snippets] == ['Name 3', 'Name 2']
+    assert [snippet.index_name for snippet in snippets] == ['3, Name', '2, Name']
+
+    snippets = profiles.list_snippets(desc=False, after=('1, Name', '11111111'))
+
+    assert [snippet.id for snippet in snippets] == ['11111112', '11111113']
+
+    snippets = profiles.list_snippets(offset=2)
+
+    assert len(snippets) == 1
+    assert snippets[0].orcid == '0000-0002-1825-0097'
+
+
+def test_it_iterates_over_profile_snippets_in_batches(
+        count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    profiles = SQLAlchemyProfiles(db)
+    for number in range(1, 6):
+        profiles.add(Profile('1111111{}'.format(number), Name('Name {}'.format(number))))
+    db.session.flush()
+    db.session.expunge_all()
+
+    with count_queries() as statements:
+        batches = list(profiles.iterate_snippets(2))
+
+    assert [[snippet.id for snippet in batch] for batch in batches] == \
+        [['11111111', '11111112'], ['11111113', '11111114'], ['11111115']]
+    assert len(statements) == 3
+    assert not db.session.identity_map
+
+    batches = list(profiles.iterate_snippets(2, after=batches[1][-1].position))
+
+    assert [[snippet.id for snippet in batch] for batch in batches] == [['11111115']]
+
+
+def test_it_counts_profiles():
+    profiles = SQLAlchemyProfiles(db)
+
+    assert len(profiles) == 0
+
+    profiles.add(Profile('11111111', Name('Name 1')))
+    profiles.add(Profile('11111112', Name('Name 2')))
+
+    assert len(profiles) == 2
+
+
+def test_it_reuses_the_count_of_profiles_until_invalidated():
+    profiles = SQLAlchemyProfiles(db, count_ttl=300)
+
+    assert len(profiles) == 0
+
+    profiles.add(Profile('11111111', Name('Name 1')))
+
+    assert len(profiles) == 0
+
+    profiles.invalidate_count()
+
+    assert len(profiles) == 1
+
+
+def test_it_recounts_profiles_when_the_count_expires():
+    profiles = SQLAlchemyProfiles(db, count_ttl=0)
+
+    assert len(profiles) == 0
+
+    profiles.add(Profile('11111111', Name('Name 1')))
+
+    assert len(profiles) == 1
+
+
 def test_it_clears_profiles():
     profiles = SQLAlchemyProfiles(db)
     profiles.add(Profile('11111111', Name('name')))
@@ -0,0 +1,126 @@
+from profiles.database import db
+from profiles.models import WebhookJob
+from profiles.repositories import SQLAlchemyWebhookJobs
+
+
+def test_it_claims_queued_jobs():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    job = webhook_jobs.claim(60)
+
+    assert job.orcid == '0000-0002-1825-0097'
+    assert job.attempts == 1
+    assert webhook_jobs.claim(60) is None
+
+
+def test_it_queues_an_orcid_once():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    assert db.session.query(WebhookJob).count() == 1
+
+
+def test_it_makes_a_job_due_again_once_its_lease_expires():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    webhook_jobs.claim(0)
+    job = webhook_jobs.claim(60)
+
+    assert job.orcid == '0000-0002-1825-0097'
+    assert job.attempts == 2
+
+
+def test_it_completes_jobs():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    webhook_jobs.complete(webhook_jobs.claim(60))
+
+    assert db.session.query(WebhookJob).count() == 0
+
+
+def test_it_keeps_a_job_queued_again_while_it_was_claimed():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    job = webhook_jobs.claim(60)
+
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    webhook_jobs.complete(job)
+
+    job = webhook_jobs.claim(60)
+
+    assert job.orcid == '0000-0002-1825-0097'
+    assert job.attempts == 1
+
+
+def test_it_delays_retrying_jobs():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    webhook_jobs.retry(webhook_jobs.claim(60), 60)
+
+    assert webhook_jobs.claim(60) is None
+
+    webhook_jobs.retry(db.session.query(WebhookJob).one(), 0)
+
+    assert webhook_jobs.claim(60).orcid == '0000-0002-1825-0097'
+
+
+def test_it_clears_jobs():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    webhook_jobs.clear()
+
+    assert webhook_jobs.claim(60) is None
+
+
+def test_it_collapses_pings_into_one_job():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+
+    for _ in range(3):
+        webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    assert webhook_jobs.claim(60).pings == 3
+
+
+def test_it_holds_jobs_back_for_a_quiet_window():
+    webhook_jobs = SQLAlchemyWebhookJobs(db, quiet_window=60)
+
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    job = db.session.query(WebhookJob).one()
+    not_before = job.not_before
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    db.session.refresh(job)
+
+    assert webhook_jobs.claim(60) is None
+    assert job.not_before == not_before
+    assert job.pings == 2
+
+
+def test_it_brings_a_job_backing_off_forward_when_pinged_again():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    webhook_jobs.retry(webhook_jobs.claim(60), 3600)
+
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+
+    job = webhook_jobs.claim(60)
+    assert job.orcid == '0000-0002-1825-0097'
+    assert job.pings == 2
+
+
+def test_it_only_keeps_pings_that_arrived_while_a_job_was_claimed():
+    webhook_jobs = SQLAlchemyWebhookJobs(db)
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    job = webhook_jobs.claim(60)
+
+    webhook_jobs.enqueue('0000-0002-1825-0097')
+    webhook_jobs.complete(job)
+
+    assert webhook_jobs.claim(60).pings == 1
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from profiles.serializer.encoder import BACKEND_STDLIB, available_backends, get_encoder
+
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_it_encodes_json(backend: str):
+    data = {'id': 'a1b2c3d4', 'name': {'preferred': 'Татьяна Яковлева'}, 'items': [1, None, True]}
+
+    encoded = get_encoder(backend)(data)
+
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded.decode('utf-8')) == data
+
+
+def test_it_always_has_the_standard_library():
+    assert BACKEND_STDLIB in available_backends()
+
+
+def test_it_defaults_to_the_fastest_backend():
+    assert get_encoder() is get_encoder(available_backends()[0])
+
+
+def test_it_rejects_unknown_backends():
+    with pytest.raises(ValueError):
+        get_encoder('foo')
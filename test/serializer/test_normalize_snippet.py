@@ -1,7 +1,7 @@
 from hypothesis import given
 from hypothesis.strategies import integers, text
 
-from profiles.models import Name, Profile
+from profiles.models import Name, Profile, ProfileSnippet
 from profiles.serializer.normalizer import normalize_snippet
 
 
@@ -33,3 +33,21 @@ def test_it_normalizes_profile_snippets(id_, preferred, index, orcid):
         },
         'orcid': orcid,
     }
+
+
+@given(text(), text(), text(), text(min_size=1))
+def test_it_normalizes_profile_snippet_rows(id_, preferred, index, orcid):
+    snippet = ProfileSnippet(id_, preferred, index)
+
+    assert normalize_snippet(snippet) == normalize_snippet(Profile(id_, Name(preferred, index)))
+
+    snippet = ProfileSnippet(id_, preferred, index, orcid)
+
+    assert normalize_snippet(snippet) == {
+        'id': id_,
+        'name': {
+            'preferred': preferred,
+            'index': index,
+        },
+        'orcid': orcid,
+    }
@@ -1,6 +1,9 @@
 import json
-from typing import Callable
+import re
+from datetime import datetime, timezone
+from typing import Callable, ContextManager, List
 
+from flask import Flask
 from flask.testing import FlaskClient
 from iso3166 import countries
 from werkzeug.datastructures import Headers
@@ -135,6 +138,58 @@ def test_list_of_profiles_in_pages(test_client: FlaskClient, commit: Callable[[]
         assert data['items'][number - 1]['id'] == str(number + 5).zfill(2)
 
 
+def test_list_of_profiles_with_a_cursor(test_client: FlaskClient,
+                                        commit: Callable[[], None]) -> None:
+    for number in range(1, 11):
+        number = str(number).zfill(2)
+        db.session.add(Profile(str(number), Name('Profile %s' % number)))
+    commit()
+
+    ids = []
+    uri = '/profiles?order=asc&per-page=4&cursor='
+    while uri:
+        response = test_client.get(uri)
+
+        assert response.status_code == 200
+
+        data = json.loads(response.data.decode('UTF-8'))
+
+        assert validate_json(data, schema_name='profile-list.v1') is True
+        assert data['total'] == 10
+
+        ids += [item['id'] for item in data['items']]
+        link = re.match('<(.+)>; rel="next"', response.headers.get('Link', ''))
+        uri = link.group(1) if link else None
+
+    assert ids == [str(number).zfill(2) for number in range(1, 11)]
+
+
+def test_empty_list_of_profiles_with_a_cursor(test_client: FlaskClient) -> None:
+    response = test_client.get('/profiles?cursor=')
+
+    assert response.status_code == 200
+    assert 'Link' not in response.headers
+
+    data = json.loads(response.data.decode('UTF-8'))
+
+    assert data['total'] == 0
+    assert not data['items']
+
+
+def test_400s_on_invalid_cursor(test_client: FlaskClient) -> None:
+    response = test_client.get('/profiles?cursor=foo')
+
+    assert response.status_code == 400
+    assert response.headers.get('Content-Type') == 'application/problem+json'
+
+
+def test_400s_on_page_and_cursor(test_client: FlaskClient) -> None:
+    response = test_client.get('/profiles?page=1&cursor=')
+
+    assert response.status_code == 400
+    assert response.headers.get('Content-Type') == 'application/problem+json'
+
+
 def test_404s_on_non_existent_page(test_client: FlaskClient) -> None:
     response = test_client.get('/profiles?page=2')
 
@@ -225,6 +280,134 @@ def test_get_profile_revalidation(test_client: FlaskClient, commit: Callable[[],
     assert response.status_code == 200
 
 
+def test_get_profile_from_the_response_cache(
+        test_client: FlaskClient, commit: Callable[[], None],
+        count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    profile = Profile('a1b2c3d4', Name('Foo Bar'), '0000-0002-1825-0097')
+
+    db.session.add(profile)
+    commit()
+
+    etag = test_client.get('/profiles/a1b2c3d4').headers.get('ETag')
+
+    with count_queries() as queries:
+        response = test_client.get('/profiles/a1b2c3d4')
+
+    assert response.status_code == 200
+    assert response.headers.get('ETag') == etag
+    # Only when the profile last changed, to check the cached response is still current.
+    assert len(queries) == 1
+
+    profile.name = Name('Baz Qux')
+    commit()
+
+    data = json.loads(test_client.get('/profiles/a1b2c3d4').data.decode('UTF-8'))
+
+    assert data['name']['preferred'] == 'Baz Qux'
+
+
+def test_get_profile_does_not_use_a_cached_response_changed_by_another_process(
+        test_client: FlaskClient, commit: Callable[[], None]) -> None:
+    db.session.add(Profile('a1b2c3d4', Name('Foo Bar')))
+    commit()
+
+    test_client.get('/profiles/a1b2c3d4')
+
+    # Changes made elsewhere don't invalidate this process's response cache.
+    db.session.execute(Profile.__table__.update().values(
+        preferred_name='Baz Qux', updated_at=datetime(2100, 1, 1, tzinfo=timezone.utc)))
+    commit()
+
+    data = json.loads(test_client.get('/profiles/a1b2c3d4').data.decode('UTF-8'))
+
+    assert data['name']['preferred'] == 'Baz Qux'
+
+
+def test_get_profile_revalidation_without_loading_the_profile(
+        app: Flask, test_client: FlaskClient, commit: Callable[[], None],
+        count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    profile = Profile('a1b2c3d4', Name('Foo Bar'), '0000-0002-1825-0097')
+
+    db.session.add(profile)
+    commit()
+
+    etag = test_client.get('/profiles/a1b2c3d4').headers.get('ETag')
+    app.profile_responses.clear()
+
+    with count_queries() as queries:
+        response = test_client.get('/profiles/a1b2c3d4', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers.get('ETag') == etag
+    assert len(queries) == 1
+
+    profile.add_email_address('foo@example.com')
+    commit()
+
+    response = test_client.get('/profiles/a1b2c3d4', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers.get('ETag') != etag
+
+
+def test_list_of_profiles_revalidation_without_listing_them(test_client: FlaskClient,
+                                                            commit: Callable[[], None]) -> None:
+    db.session.add(Profile('a1b2c3d4', Name('Foo Bar')))
+    commit()
+
+    etag = test_client.get('/profiles').headers.get('ETag')
+
+    response = test_client.get('/profiles', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+
+    response = test_client.get('/profiles?order=asc', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+
+    db.session.add(Profile('b2c3d4e5', Name('Baz Qux')))
+    commit()
+
+    response = test_client.get('/profiles', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+
+
+def test_list_of_profiles_revalidation_sees_profiles_removed_by_another_process(
+        test_client: FlaskClient, commit: Callable[[], None]) -> None:
+    db.session.add(Profile('a1b2c3d4', Name('Foo Bar')))
+    db.session.add(Profile('b2c3d4e5', Name('Baz Qux')))
+    commit()
+
+    etag = test_client.get('/profiles').headers.get('ETag')
+
+    db.session.execute(Profile.__table__.delete().where(Profile.__table__.c.id == 'a1b2c3d4'))
+    commit()
+
+    response = test_client.get('/profiles', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+
+
+def test_get_profile_last_modified(test_client: FlaskClient, commit: Callable[[], None],
+                                   count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    db.session.add(Profile('a1b2c3d4', Name('Foo Bar')))
+    commit()
+
+    response = test_client.get('/profiles/a1b2c3d4')
+    last_modified = response.headers.get('Last-Modified')
+
+    assert last_modified is not None
+    assert test_client.get('/profiles').headers.get('Last-Modified') is not None
+
+    with count_queries() as queries:
+        response = test_client.get('/profiles/a1b2c3d4',
+                                   headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+
 def test_profile_not_found(test_client: FlaskClient) -> None:
     response = test_client.get('/profiles/foo')
 
@@ -399,3 +582,98 @@ def test_it_does_not_return_null_values_in_response(test_client: FlaskClient,
     assert response.headers.get('Content-Type') == 'application/vnd.elife.profile+json;version=1'
     assert validate_json(data, schema_name='profile.v1') is True
     assert contains_none_values(data) is False
+
+
+def test_get_a_batch_of_profiles(test_client: FlaskClient, commit: Callable[[], None],
+                                 count_queries: Callable[[], ContextManager[List[str]]]) -> None:
+    for profile_id in ['a1b2c3d4', 'b2c3d4e5', 'c3d4e5f6']:
+        profile = Profile(profile_id, Name('Profile {}'.format(profile_id)))
+        profile.add_email_address('{}@example.com'.format(profile_id), restricted=True)
+        db.session.add(profile)
+    commit()
+
+    test_client.get('/profiles/b2c3d4e5')
+
+    with count_queries() as queries:
+        response = test_client.get('/profiles/batch?id=c3d4e5f6&id=foo&id=b2c3d4e5&id=a1b2c3d4'
+                                   '&id=c3d4e5f6')
+
+    data = json.loads(response.data.decode('UTF-8'))
+
+    assert response.status_code == 200
+    assert response.headers.get(
+        'Content-Type') == 'application/vnd.elife.profile-batch+json;version=1'
+    assert 'ETag' in response.headers
+    assert data['total'] == 3
+    assert [item['id'] for item in data['items']] == ['c3d4e5f6', 'b2c3d4e5', 'a1b2c3d4']
+    assert all(validate_json(item, schema_name='profile.v1') for item in data['items'])
+    assert not any(item['emailAddresses'] for item in data['items'])
+    # One query for when the profiles last changed, one for the profiles that weren't cached,
+    # and one for each of their relationships.
+    assert len(queries) == 4
+
+    response = test_client.get('/profiles/batch?id=a1b2c3d4',
+                               headers={'X-Consumer-Groups': 'View-restricted-profiles'})
+    data = json.loads(response.data.decode('UTF-8'))
+
+    assert [e['value'] for e in data['items'][0]['emailAddresses']] == ['a1b2c3d4@example.com']
+
+
+def test_get_a_batch_of_profiles_requires_ids(test_client: FlaskClient) -> None:
+    assert test_client.get('/profiles/batch').status_code == 400
+    assert test_client.get('/profiles/batch?{}'.format(
+        '&'.join('id={}'.format(number) for number in range(101)))).status_code == 400
+
+
+def test_get_a_profile_by_orcid(test_client: FlaskClient, commit: Callable[[], None]) -> None:
+    db.session.add(Profile('a1b2c3d4', Name('Foo Bar'), '0000-0002-1825-0097'))
+    commit()
+
+    response = test_client.get('/profiles/orcid/0000-0002-1825-0097')
+    data = json.loads(response.data.decode('UTF-8'))
+
+    assert response.status_code == 200
+    assert response.headers.get('Cache-Control') == 'max-age=300, public, stale-if-error=86400,' \
+                                                    'stale-while-revalidate=300'
+    assert response.headers.get('Content-Type') == 'application/vnd.elife.profile+json;version=1'
+    assert data['id'] == 'a1b2c3d4'
+
+    assert test_client.get('/profiles/orcid/0000-0002-1825-0098').status_code == 404
+
+
+def test_get_a_profile_by_email_address(test_client: FlaskClient,
+                                        commit: Callable[[], None]) -> None:
+    profile = Profile('a1b2c3d4', Name('Foo Bar'))
+    profile.add_email_address('1@example.com')
+    profile.add_email_address('2@example.com', restricted=True)
+    db.session.add(profile)
+    commit()
+
+    response = test_client.get('/profiles/email/1@example.com')
+
+    assert response.status_code == 200
+    assert json.loads(response.data.decode('UTF-8'))['id'] == 'a1b2c3d4'
+
+    assert test_client.get('/profiles/email/2@example.com').status_code == 404
+    assert test_client.get('/profiles/email/2@example.com', headers={
+        'X-Consumer-Groups': 'View-restricted-profiles'}).status_code == 200
+    assert test_client.get('/profiles/email/3@example.com').status_code == 404
+
+
+def test_get_a_batch_of_profiles_by_orcid_and_email_address(test_client: FlaskClient,
+                                                            commit: Callable[[], None]) -> None:
+    profile1 = Profile('a1b2c3d4', Name('Foo Bar'), '0000-0002-1825-0097')
+    profile2 = Profile('b2c3d4e5', Name('Baz Qux'))
+    profile2.add_email_address('1@example.com')
+    db.session.add(profile1)
+    db.session.add(profile2)
+    commit()
+
+    response = test_client.get('/profiles/batch?orcid=0000-0002-1825-0097&email=1@example.com'
+                               '&email=2@example.com&id=a1b2c3d4')
+    data = json.loads(response.data.decode('UTF-8'))
+
+    assert response.status_code == 200
+    assert response.headers.get(
+        'Content-Type') == 'application/vnd.elife.profile-batch+json;version=1'
+    assert [item['id'] for item in data['items']] == ['a1b2c3d4', 'b2c3d4e5']
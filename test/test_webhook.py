@@ -1,12 +1,16 @@
 import json
-from typing import Callable
+from typing import Callable, Dict
+from unittest.mock import MagicMock
 
+from flask import Flask
 from flask.testing import FlaskClient
+from itsdangerous import URLSafeSerializer
 import pytest
 import requests_mock
 
+from profiles.api import webhook
 from profiles.database import db
-from profiles.exceptions import OrcidTokenNotFound
+from profiles.exceptions import OrcidTokenNotFound, ProfileNotFound
 from profiles.models import Name, OrcidToken, Profile
 from profiles.repositories import SQLAlchemyOrcidTokens
 from profiles.utilities import expires_at
@@ -170,3 +174,67 @@ def test_it_returns_500_on_an_orcid_error(profile: Profile, orcid_token: OrcidTo
 
     assert response.status_code == 500
     assert response.headers.get('Content-Type') == 'application/problem+json'
+
+
+@pytest.fixture
+def queue_client(orcid_config: Dict[str, str], mock_orcid_client: MagicMock,
+                 url_safe_serializer: URLSafeSerializer) -> Callable[..., FlaskClient]:
+    def create(profiles: MagicMock, webhook_jobs: MagicMock) -> FlaskClient:
+        app = Flask(__name__)
+        app.register_blueprint(webhook.create_blueprint(profiles, orcid_config,
+                                                        mock_orcid_client, MagicMock(),
+                                                        url_safe_serializer, webhook_jobs))
+        return app.test_client()
+
+    return create
+
+
+def test_it_queues_an_update_and_returns_202(queue_client: Callable[..., FlaskClient],
+                                             mock_orcid_client: MagicMock,
+                                             webhook_payload: str) -> None:
+    webhook_jobs = MagicMock()
+
+    response = queue_client(MagicMock(), webhook_jobs) \
+        .post('/orcid-webhook/{}'.format(webhook_payload))
+
+    assert response.status_code == 202
+    webhook_jobs.enqueue.assert_called_once_with('0000-0002-1825-0097')
+    assert not mock_orcid_client.get_record.called
+
+
+def test_it_does_not_queue_updates_for_unknown_profiles(queue_client: Callable[..., FlaskClient],
+                                                        webhook_payload: str) -> None:
+    profiles = MagicMock()
+    profiles.get_by_orcid.side_effect = ProfileNotFound('Profile not found')
+    webhook_jobs = MagicMock()
+
+    response = queue_client(profiles, webhook_jobs) \
+        .post('/orcid-webhook/{}'.format(webhook_payload))
+
+    assert response.status_code == 404
+    assert not webhook_jobs.enqueue.called
+
+
+def test_it_can_fetch_only_the_sections_it_needs(orcid_config: Dict[str, str],
+                                                 mock_orcid_client: MagicMock,
+                                                 url_safe_serializer: URLSafeSerializer,
+                                                 webhook_payload: str) -> None:
+    profile = Profile('a1b2c3d4', Name('Foo Bar'), '0000-0002-1825-0097')
+    profiles = MagicMock()
+    profiles.get_by_orcid.return_value = profile
+    mock_orcid_client.get_partial_record.return_value = {'person': {
+        'name': {'family-name': {'value': 'Family Name'},
+                 'given-names': {'value': 'Given Names'}}
+    }}
+
+    app = Flask(__name__)
+    app.register_blueprint(webhook.create_blueprint(profiles,
+                                                    dict(orcid_config, record_mode='sections'),
+                                                    mock_orcid_client, MagicMock(),
+                                                    url_safe_serializer))
+
+    response = app.test_client().post('/orcid-webhook/{}'.format(webhook_payload))
+
+    assert response.status_code == 204
+    assert profile.name.preferred == 'Given Names Family Name'
+    assert not mock_orcid_client.get_record.called
@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from profiles.utilities import ResponseCache
+
+
+def test_it_stores_variants_of_responses():
+    response_cache = ResponseCache(10, 30)
+
+    response_cache.put('a1b2c3d4', 'public', b'{}', '"etag"', response_cache.generation)
+
+    assert response_cache.get('a1b2c3d4', 'public') == (b'{}', '"etag"')
+    assert response_cache.get('a1b2c3d4', 'restricted') is None
+    assert response_cache.get('b2c3d4e5', 'public') is None
+
+
+def test_it_expires_responses():
+    response_cache = ResponseCache(10, 30)
+
+    with patch('time.monotonic', return_value=1000.0):
+        response_cache.put('a1b2c3d4', 'public', b'{}', '"etag"', response_cache.generation)
+
+    with patch('time.monotonic', return_value=1031.0):
+        assert response_cache.get('a1b2c3d4', 'public') is None
+
+
+def test_it_invalidates_every_variant_of_a_response():
+    response_cache = ResponseCache(10, 30)
+    response_cache.put('a1b2c3d4', 'public', b'{}', '"etag"', response_cache.generation)
+    response_cache.put('a1b2c3d4', 'restricted', b'{}', '"etag"', response_cache.generation)
+    response_cache.put('b2c3d4e5', 'public', b'{}', '"etag"', response_cache.generation)
+
+    response_cache.invalidate(['a1b2c3d4'])
+
+    assert response_cache.get('a1b2c3d4', 'public') is None
+    assert response_cache.get('a1b2c3d4', 'restricted') is None
+    assert response_cache.get('b2c3d4e5', 'public') == (b'{}', '"etag"')
+
+
+def test_it_does_not_store_responses_rendered_before_an_invalidation():
+    response_cache = ResponseCache(10, 30)
+    generation = response_cache.generation
+
+    response_cache.invalidate(['a1b2c3d4'])
+    response_cache.put('a1b2c3d4', 'public', b'{}', '"etag"', generation)
+
+    assert response_cache.get('a1b2c3d4', 'public') is None
+
+
+def test_it_forgets_the_least_recently_used_responses():
+    response_cache = ResponseCache(2, 30)
+    response_cache.put('a1b2c3d4', 'public', b'{}', '"etag"', response_cache.generation)
+    response_cache.put('b2c3d4e5', 'public', b'{}', '"etag"', response_cache.generation)
+    response_cache.get('a1b2c3d4', 'public')
+    response_cache.put('c3d4e5f6', 'public', b'{}', '"etag"', response_cache.generation)
+
+    assert response_cache.get('a1b2c3d4', 'public') is not None
+    assert response_cache.get('b2c3d4e5', 'public') is None